@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+# JWT authentication without a user query per request. Tokens issued by
+# core.serializers.TokenObtainPairSerializer carry the user's id, customer id and token_version.
+# Each request checks them against the user's auth state (is_active, is_staff, is_superuser,
+# token_version), which comes from a small in-process LRU, then the shared cache, then the
+# database. The User row itself is only loaded when something reads another attribute.
+#
+# Changes to a user's password, is_active, is_staff or is_superuser bump User.token_version
+# (see core.signals.handlers), which rejects every token issued before. The change is stored
+# in the database, so it reaches every process once its cached auth state expires: at once in
+# this process, and within USER_CACHE_TIMEOUT seconds elsewhere.
+
+USER_CACHE_TIMEOUT = getattr(settings, 'CORE_USER_CACHE_TIMEOUT', 60)
+LOCAL_USER_CACHE_TIMEOUT = getattr(settings, 'CORE_LOCAL_USER_CACHE_TIMEOUT', 30)
+LOCAL_USER_CACHE_SIZE = getattr(settings, 'CORE_LOCAL_USER_CACHE_SIZE', 10000)
+AUTH_STATE_FIELDS = ['is_active', 'is_staff', 'is_superuser', 'token_version']
+
+_local_states = OrderedDict()
+_local_states_lock = threading.Lock()
+
+
+def auth_state_key(user_id):
+    return f'core:user-auth:{user_id}'
+
+
+def get_auth_state(user_id):
+    # {field: value} for AUTH_STATE_FIELDS, or None when there is no such user
+    now = time.monotonic()
+    with _local_states_lock:
+        entry = _local_states.get(user_id)
+        if entry is not None and entry[0] > now:
+            _local_states.move_to_end(user_id)
+            return entry[1]
+
+    state = cache.get(auth_state_key(user_id))
+    if state is None:
+        state = get_user_model().objects.filter(pk=user_id).values(*AUTH_STATE_FIELDS).first()
+        if state is None:
+            return None
+        cache.set(auth_state_key(user_id), state, USER_CACHE_TIMEOUT)
+    with _local_states_lock:
+        _local_states[user_id] = (now + LOCAL_USER_CACHE_TIMEOUT, state)
+        _local_states.move_to_end(user_id)
+        while len(_local_states) > LOCAL_USER_CACHE_SIZE:
+            _local_states.popitem(last=False)
+    return state
+
+
+def forget_user(user_id):
+    with _local_states_lock:
+        _local_states.pop(user_id, None)
+    cache.delete(auth_state_key(user_id))
+
+
+class ClaimsUser(SimpleLazyObject):
+    # Stands in for the User. id, pk and customer_id come from the token, is_active, is_staff
+    # and is_superuser from the auth state. Reading anything else loads the user.
+    def __init__(self, token, state):
+        user_id = token[api_settings.USER_ID_CLAIM]
+        super().__init__(lambda: get_user_model().objects.filter(pk=user_id).first())
+        self.__dict__.update({
+            'id': user_id,
+            'pk': user_id,
+            'customer_id': token.get('customer_id'),
+            'is_active': state['is_active'],
+            'is_staff': state['is_staff'],
+            'is_superuser': state['is_superuser'],
+            'is_authenticated': True,
+            'is_anonymous': False,
+        })
+
+    def __bool__(self):
+        return True
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        state = get_auth_state(user_id)
+        if state is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not state['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        # Tokens issued before the claim was added count as version 0
+        if validated_token.get('token_version', 0) != state['token_version']:
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return ClaimsUser(validated_token, state)
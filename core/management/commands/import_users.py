@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.onboarding import UserImporter
+from store.importers import read_csv_rows, read_ndjson_rows
+
+
+class Command(BaseCommand):
+    help = ('Imports users from a CSV or NDJSON file (username, email, first_name, last_name and '
+            'password or password_hash) and creates their customers, in bulk.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--processes', type=int, help='Password hashing processes (default: one per CPU).')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'ndjson')
+        reader = read_csv_rows if file_format == 'csv' else read_ndjson_rows
+        try:
+            lines = open(options['path'], newline='')
+        except OSError as error:
+            raise CommandError(error)
+        with lines:
+            importer = UserImporter(chunk_size=options['chunk_size'], processes=options['processes'])
+            report = importer.run(reader(lines))
+        for error in report['errors']:
+            self.stderr.write(json.dumps(error, default=str))
+        self.stdout.write(self.style.SUCCESS(f'Created {report["created"]} users, {report["failed"]} rows failed.'))
@@ -3,4 +3,6 @@ from django.db import models
 
 # Create your models here.
 class User(AbstractUser):
-    email = models.EmailField(unique=True)
\ No newline at end of file
+    email = models.EmailField(unique=True)
+    # Bumped when the password or permissions change, which revokes the tokens carrying an older one (core.authentication)
+    token_version = models.PositiveIntegerField(default=0, editable=False)
@@ -0,0 +1,142 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+
+from core.models import User
+from store.models import Customer
+
+# Bulk account import. Users and their Customers are inserted with bulk_create, chunk by chunk,
+# which skips the User post_save handler that would otherwise create each Customer with its own
+# INSERT. Every imported user still gets a Customer with the model defaults, as that handler does.
+# Raw passwords are hashed in a process pool, started on the first row that has one; rows can
+# instead carry a hash produced by Django (password_hash), which is stored as is and is the only
+# way to import millions of accounts quickly.
+
+
+class UserImportSerializer(serializers.Serializer):
+    # Uniqueness is checked once per chunk by UserImporter instead of by a query per field and row.
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    email = serializers.EmailField(max_length=254)
+    first_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    last_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    password = serializers.CharField(required=False, allow_blank=True, trim_whitespace=False)
+    password_hash = serializers.CharField(max_length=128, required=False, allow_blank=True)
+
+    # Normalized like UserManager.create_user does
+    def validate_username(self, value):
+        return User.normalize_username(value)
+
+    def validate_email(self, value):
+        return User.objects.normalize_email(value)
+
+
+class UserImporter:
+    def __init__(self, chunk_size=1000, processes=None, max_errors=1000):
+        self.chunk_size = chunk_size
+        self.processes = processes
+        self.max_errors = max_errors
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.pool = None
+
+    def run(self, rows):
+        rows = enumerate(rows, start=1)
+        try:
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                self.import_chunk(chunk)
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+        return self.report()
+
+    def hash_passwords(self, passwords):
+        if not passwords:
+            return []
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.processes, initializer=django.setup)
+        return list(self.pool.map(make_password, passwords, chunksize=max(1, len(passwords) // 64)))
+
+    def report(self):
+        return {'created': self.created, 'failed': self.failed, 'errors': self.errors}
+
+    def add_error(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def get_taken(self, valid):
+        # Usernames and emails of the chunk that are already in use
+        taken_usernames = set(User.objects.filter(username__in=[data['username'] for row_number, data in valid])
+                              .values_list('username', flat=True))
+        taken_emails = set(User.objects.filter(email__in=[data['email'] for row_number, data in valid])
+                           .values_list('email', flat=True))
+        return taken_usernames, taken_emails
+
+    def import_chunk(self, chunk):
+        valid = []
+        for row_number, row in chunk:
+            if not isinstance(row, dict):
+                self.add_error(row_number, {'non_field_errors': ['Invalid row']})
+                continue
+            serializer = UserImportSerializer(data=row)
+            if not serializer.is_valid():
+                self.add_error(row_number, serializer.errors)
+                continue
+            valid.append((row_number, serializer.validated_data))
+
+        taken_usernames, taken_emails = self.get_taken(valid)
+        accepted = []
+        for row_number, data in valid:
+            if data['username'] in taken_usernames:
+                self.add_error(row_number, {'username': ['A user with that username already exists.']})
+            elif data['email'] in taken_emails:
+                self.add_error(row_number, {'email': ['A user with that email already exists.']})
+            else:
+                taken_usernames.add(data['username'])
+                taken_emails.add(data['email'])
+                accepted.append((row_number, data))
+        if not accepted:
+            return
+
+        to_hash = [data for row_number, data in accepted if not data.get('password_hash')]
+        # An empty password gives an unusable one, like create_user(password=None)
+        hashes = self.hash_passwords([data.get('password') or None for data in to_hash])
+        for data, password_hash in zip(to_hash, hashes):
+            data['password_hash'] = password_hash
+
+        users = [
+            (row_number, User(username=data['username'], email=data['email'], first_name=data['first_name'],
+                              last_name=data['last_name'], password=data['password_hash']))
+            for row_number, data in accepted
+        ]
+        try:
+            self.insert([user for row_number, user in users])
+        except IntegrityError:
+            # A duplicate the checks above can't see: one differing only in case under a
+            # case-insensitive collation, or a user created meanwhile. Insert row by row to find it.
+            for row_number, user in users:
+                try:
+                    self.insert([user])
+                except IntegrityError:
+                    self.add_error(row_number, {'non_field_errors': ['A user with that username or email already exists.']})
+
+    def insert(self, users):
+        # Each insert is its own transaction (or savepoint), so a failed one leaves nothing behind
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=self.chunk_size)
+            # bulk_create doesn't return primary keys on every database, so look them up by username.
+            user_ids = User.objects.filter(username__in=[user.username for user in users]) \
+                .values_list('id', flat=True)
+            Customer.objects.bulk_create([Customer(user_id=user_id) for user_id in user_ids],
+                                         batch_size=self.chunk_size)
+        self.created += len(users)
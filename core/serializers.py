@@ -1,5 +1,8 @@
 from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer
 from djoser.serializers import UserSerializer as BaseUserSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer as BaseTokenObtainPairSerializer
+
+from store.models import Customer
 
 
 class UserCreateSerializer(BaseUserCreateSerializer):
@@ -10,3 +13,14 @@ class UserCreateSerializer(BaseUserCreateSerializer):
 class UserSerializer(BaseUserSerializer):
     class Meta(BaseUserSerializer.Meta):
         fields = ['id','username','email','first_name','last_name']
+
+
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    # Claims trusted by core.authentication.ClaimsJWTAuthentication. They are copied into the
+    # access tokens made from the refresh token as well.
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['customer_id'] = Customer.objects.filter(user_id=user.id).values_list('id', flat=True).first()
+        token['token_version'] = user.token_version
+        return token
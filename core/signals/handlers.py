@@ -1,6 +1,41 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
 from store.signals import order_created
 from django.dispatch import receiver
 
+from core.authentication import forget_user
+
+# Fields whose change revokes the user's tokens (see core.authentication)
+AUTH_FIELDS = ['password', 'is_active', 'is_staff', 'is_superuser']
+
 @receiver(order_created)
 def on_order_created(sender,**kwargs):
     print(kwargs['order'])
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def bump_token_version(sender, instance, **kwargs):
+    instance._token_version_bumped = False
+    if instance.pk is None:
+        return
+    previous = sender.objects.filter(pk=instance.pk).values(*AUTH_FIELDS, 'token_version').first()
+    if previous is None:
+        return
+    # Never lowered by a stale instance
+    instance.token_version = max(instance.token_version, previous['token_version'])
+    if any(previous[field] != getattr(instance, field) for field in AUTH_FIELDS):
+        instance.token_version = previous['token_version'] + 1
+        instance._token_version_bumped = True
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def forget_saved_user(sender, instance, created, update_fields, **kwargs):
+    if getattr(instance, '_token_version_bumped', False) \
+            and update_fields is not None and 'token_version' not in update_fields:
+        sender.objects.filter(pk=instance.pk).update(token_version=instance.token_version)
+    forget_user(instance.pk)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_deleted_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
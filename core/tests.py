@@ -1,3 +1,120 @@
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from core import authentication, onboarding
+from core.models import User
+from core.onboarding import UserImporter
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication._local_states.clear()
+        self.user = User.objects.create_user('customer', 'customer@example.com', 'pw')
+        response = APIClient().post('/auth/jwt/create/', {'username': 'customer', 'password': 'pw'})
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='JWT ' + response.data['access'])
+
+    def forget_everything(self):
+        # As in another process, or after the cache evicted the entries
+        cache.clear()
+        authentication._local_states.clear()
+
+    def test_authenticates_without_loading_the_user(self):
+        self.assertEqual(self.client.get('/store/orders/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/store/carts/x/').status_code, 404)
+
+    def test_password_change_revokes_tokens_persistently(self):
+        self.user.set_password('new')
+        self.user.save()
+        self.forget_everything()
+        self.assertEqual(self.client.get('/store/orders/').status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get('/store/orders/').status_code, 200)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.forget_everything()
+        self.assertEqual(self.client.get('/store/orders/').status_code, 401)
+
+    def test_revocation_survives_save_with_update_fields(self):
+        self.user.is_staff = True
+        self.user.save(update_fields=['is_staff'])
+        self.forget_everything()
+        self.assertEqual(User.objects.get(pk=self.user.pk).token_version, 1)
+        self.assertEqual(self.client.get('/store/orders/').status_code, 401)
+
+    def test_cached_state_holds_no_password(self):
+        self.client.get('/store/orders/')
+        state = cache.get(authentication.auth_state_key(self.user.pk))
+        self.assertEqual(set(state), set(authentication.AUTH_STATE_FIELDS))
+
+    def test_local_cache_is_bounded(self):
+        users = [User.objects.create_user(f'user{index}', f'user{index}@example.com', 'pw') for index in range(5)]
+        with mock.patch.object(authentication, 'LOCAL_USER_CACHE_SIZE', 3):
+            for user in users:
+                authentication.get_auth_state(user.pk)
+        self.assertEqual(list(authentication._local_states), [user.pk for user in users[-3:]])
+
+
+class UserImporterTests(TestCase):
+    def row(self, username, email=None, **fields):
+        return {'username': username, 'email': email or f'{username}@example.com', **fields}
+
+    def test_invalid_rows_are_reported(self):
+        report = UserImporter().run([
+            self.row('ann', password_hash=make_password('pw')),
+            self.row('bob', email='not an email'),
+            {'email': 'carl@example.com'},
+            'not a row',
+        ])
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['failed'], 3)
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3, 4])
+        self.assertIn('email', report['errors'][0]['errors'])
+        self.assertIn('username', report['errors'][1]['errors'])
+        self.assertTrue(User.objects.get(username='ann').customer)
+
+    def test_duplicates_are_reported(self):
+        User.objects.create_user('ann', 'ann@example.com', 'pw')
+        report = UserImporter().run([
+            self.row('ann', email='other@example.com'),
+            self.row('bob', email='Bob@EXAMPLE.com'),
+            # Same address once the domain is normalized
+            self.row('bobby', email='Bob@example.com'),
+            self.row('bob', email='bob2@example.com'),
+        ])
+        self.assertEqual(report['created'], 1)
+        self.assertEqual([error['row'] for error in report['errors']], [1, 3, 4])
+        self.assertEqual(User.objects.get(username='bob').email, 'Bob@example.com')
+
+    def test_duplicate_missed_by_the_checks_fails_only_its_row(self):
+        User.objects.create_user('ann', 'ann@example.com', 'pw')
+        rows = [self.row('bob'), self.row('ann', email='other@example.com'), self.row('carl')]
+        # As if ann signed up between the checks and the insert
+        with mock.patch.object(UserImporter, 'get_taken', return_value=(set(), set())):
+            report = UserImporter().run(rows)
+        self.assertEqual(report['created'], 2)
+        self.assertEqual([error['row'] for error in report['errors']], [2])
+        self.assertEqual(set(User.objects.values_list('username', flat=True)), {'ann', 'bob', 'carl'})
+        self.assertEqual(User.objects.filter(customer__isnull=False).count(), 3)
+
+    def test_passwords_verify(self):
+        report = UserImporter(processes=1).run([
+            self.row('ann', password='secret'),
+            self.row('bob', password_hash=make_password('hashed')),
+            self.row('carl'),
+        ])
+        self.assertEqual(report['created'], 3)
+        self.assertTrue(User.objects.get(username='ann').check_password('secret'))
+        self.assertTrue(User.objects.get(username='bob').check_password('hashed'))
+        self.assertFalse(User.objects.get(username='carl').has_usable_password())
 
-# Create your tests here.
+    def test_no_pool_without_passwords_to_hash(self):
+        with mock.patch.object(onboarding, 'ProcessPoolExecutor') as pool:
+            UserImporter().run([self.row('ann', password_hash=make_password('pw'))])
+        pool.assert_not_called()
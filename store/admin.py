@@ -1,9 +1,13 @@
+from django import forms
 from django.contrib import admin, messages
-from django.db.models.aggregates import Count
+from django.contrib.admin import helpers
 from django.db.models.query import QuerySet
+from django.template.response import TemplateResponse
+from django.utils import timezone
 from django.utils.html import format_html, urlencode
 from django.urls import reverse
-from . import models
+from . import admin_jobs, models
+from .pagination import EstimatedCountPaginator
 
 
 class InventoryFilter(admin.SimpleListFilter):
@@ -20,20 +24,37 @@ class InventoryFilter(admin.SimpleListFilter):
             return queryset.filter(inventory__lt=10)
 
 
+class PriceUpdateForm(forms.Form):
+    percent = forms.DecimalField(
+        max_digits=5, decimal_places=2, min_value=-99, max_value=1000,
+        help_text='Percentage to change unit prices by, negative to lower them.')
+
+
+def message_job(model_admin, request, job):
+    url = reverse('admin:store_adminjob_change', args=[job.id])
+    model_admin.message_user(
+        request,
+        format_html('Started <a href="{}">job {}</a>. It runs in the background.', url, job.id),
+        messages.SUCCESS
+    )
+
+
 @admin.register(models.Product)
 class ProductAdmin(admin.ModelAdmin):
     autocomplete_fields = ['collection']
     prepopulated_fields = {
         'slug': ['title']
     }
-    actions = ['clear_inventory']
+    actions = ['clear_inventory', 'update_prices']
     list_display = ['title', 'unit_price',
                     'inventory_status', 'collection_title']
     list_editable = ['unit_price']
     list_filter = ['collection', 'last_update', InventoryFilter]
     list_per_page = 10
     list_select_related = ['collection']
+    paginator = EstimatedCountPaginator
     search_fields = ['title']
+    show_full_result_count = False
 
     def collection_title(self, product):
         return product.collection.title
@@ -44,14 +65,30 @@ class ProductAdmin(admin.ModelAdmin):
             return 'Low'
         return 'OK'
 
+    # Bulk actions run in chunks by `manage.py run_admin_jobs` (see store.admin_jobs)
     @admin.action(description='Clear inventory')
     def clear_inventory(self, request, queryset):
-        updated_count = queryset.update(inventory=0)
-        self.message_user(
-            request,
-            f'{updated_count} products were successfully updated.',
-            messages.ERROR
-        )
+        job = admin_jobs.enqueue('clear_inventory', admin_jobs.get_selection(request, queryset), request.user)
+        message_job(self, request, job)
+
+    @admin.action(description='Update prices')
+    def update_prices(self, request, queryset):
+        form = PriceUpdateForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            job = admin_jobs.enqueue(
+                'update_prices', admin_jobs.get_selection(request, queryset), request.user,
+                percent=form.cleaned_data['percent'])
+            message_job(self, request, job)
+            return None
+        return TemplateResponse(request, 'admin/store/product/update_prices.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Update prices',
+            'opts': self.model._meta,
+            'form': form,
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across') == '1',
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
 
 
 @admin.register(models.Collection)
@@ -70,11 +107,6 @@ class CollectionAdmin(admin.ModelAdmin):
             }))
         return format_html('<a href="{}">{} Products</a>', url, collection.products_count)
 
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(
-            products_count=Count('product')
-        )
-
 
 @admin.register(models.Customer)
 class CustomerAdmin(admin.ModelAdmin):
@@ -83,7 +115,9 @@ class CustomerAdmin(admin.ModelAdmin):
     list_per_page = 10
     list_select_related = ['user']
     ordering = ['user__first_name', 'user__last_name']
+    paginator = EstimatedCountPaginator
     search_fields = ['first_name__istartswith', 'last_name__istartswith']
+    show_full_result_count = False
 
     @admin.display(ordering='orders_count')
     def orders(self, customer):
@@ -95,11 +129,6 @@ class CustomerAdmin(admin.ModelAdmin):
             }))
         return format_html('<a href="{}">{} Orders</a>', url, customer.orders_count)
 
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(
-            orders_count=Count('order')
-        )
-
 
 class OrderItemInline(admin.TabularInline):
     autocomplete_fields = ['product']
@@ -114,3 +143,32 @@ class OrderAdmin(admin.ModelAdmin):
     autocomplete_fields = ['customer']
     inlines = [OrderItemInline]
     list_display = ['id', 'placed_at', 'customer']
+    list_select_related = ['customer__user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(models.AdminJob)
+class AdminJobAdmin(admin.ModelAdmin):
+    actions = ['cancel']
+    list_display = ['id', 'action', 'status', 'progress', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'action']
+    list_select_related = ['created_by']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def progress(self, job):
+        if not job.total:
+            return job.processed
+        return f'{job.processed} / {job.total} ({job.processed * 100 // job.total}%)'
+
+    @admin.action(description='Cancel selected jobs')
+    def cancel(self, request, queryset):
+        cancelled_count = queryset \
+            .filter(status__in=[models.AdminJob.STATUS_PENDING, models.AdminJob.STATUS_RUNNING]) \
+            .update(status=models.AdminJob.STATUS_CANCELLED, finished_at=timezone.now())
+        self.message_user(request, f'{cancelled_count} jobs were cancelled.')
@@ -0,0 +1,125 @@
+import traceback
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from store.models import AdminJob, Product
+from store.signals import products_bulk_updated
+
+# Bulk admin actions that run outside the request. enqueue() stores the admin's selection, the
+# picked primary keys or the changelist's filters for "select all" across a large table, and
+# `manage.py run_admin_jobs` applies the action to it in primary key order, one chunk per short
+# transaction, so row locks are only ever held for one chunk. The job row keeps the last primary
+# key done, so a job resumes where it stopped, and the admin shows its progress.
+
+# Limits of Product.unit_price (MinValueValidator and max_digits)
+MIN_PRICE = Decimal('1.00')
+MAX_PRICE = Decimal('9999.99')
+
+
+def announce_products_updated(product_ids):
+    collection_ids = set(Product.objects.filter(id__in=product_ids).values_list('collection_id', flat=True))
+    transaction.on_commit(lambda: products_bulk_updated.send_robust(
+        sender=AdminJob, product_ids=product_ids, collection_ids=collection_ids))
+
+
+def clear_inventory(product_ids):
+    # last_update moves so the conditional GET validators (store.caching) change
+    Product.objects.filter(id__in=product_ids).update(inventory=0, last_update=timezone.now())
+    announce_products_updated(product_ids)
+
+
+def update_prices(product_ids, percent):
+    # Changes unit_price by `percent` (negative to lower it), rounded to the cent and kept within
+    # the field's limits. Effective prices follow through products_bulk_updated.
+    factor = 1 + Decimal(percent) / 100
+    now = timezone.now()
+    products = list(Product.objects.select_for_update().filter(id__in=product_ids).only('id', 'unit_price'))
+    for product in products:
+        unit_price = (product.unit_price * factor).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        product.unit_price = min(max(unit_price, MIN_PRICE), MAX_PRICE)
+        product.last_update = now
+    Product.objects.bulk_update(products, ['unit_price', 'last_update'])
+    announce_products_updated(product_ids)
+
+
+# Actions run with the primary keys of a chunk and the job's params.
+ACTIONS = {
+    'clear_inventory': (Product, clear_inventory),
+    'update_prices': (Product, update_prices),
+}
+
+
+def get_selection(request, queryset):
+    # Selection of an admin action: the changelist's filters when "select all" was used,
+    # the picked primary keys otherwise.
+    if request.POST.get('select_across') == '1':
+        filters = dict(request.GET.lists())
+        filters.pop(PAGE_VAR, None)
+        return {'filters': filters}
+    return {'pks': list(queryset.values_list('pk', flat=True))}
+
+
+def enqueue(action, selection, user=None, **params):
+    if action not in ACTIONS:
+        raise ValueError(f'Unknown admin job action: {action}')
+    return AdminJob.objects.create(action=action, params=params, selection=selection, created_by=user)
+
+
+def get_queryset(job):
+    model, _ = ACTIONS[job.action]
+    if 'pks' in job.selection:
+        return model._default_manager.filter(pk__in=job.selection['pks'])
+    # Rebuilt by the model's changelist, so filters and search match what the admin selected
+    request = RequestFactory().get('/', job.selection['filters'])
+    request.user = job.created_by or AnonymousUser()
+    model_admin = admin.site._registry[model]
+    return model_admin.get_changelist_instance(request).get_queryset(request)
+
+
+def run_chunk(chunk_size=500):
+    # Runs the next chunk of the oldest unfinished job and returns the job, or None when there
+    # is nothing to do. The job row stays locked for the chunk's transaction, so workers running
+    # side by side never process the same chunk, and a job cancelled in the admin stops at the
+    # next chunk. A failing chunk is rolled back and fails the job.
+    with transaction.atomic():
+        jobs = AdminJob.objects \
+            .filter(status__in=[AdminJob.STATUS_PENDING, AdminJob.STATUS_RUNNING]) \
+            .order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            jobs = jobs.select_for_update(skip_locked=True)
+        else:
+            jobs = jobs.select_for_update()
+        job = jobs.first()
+        if job is None:
+            return None
+
+        try:
+            with transaction.atomic():
+                queryset = get_queryset(job)
+                if job.status == AdminJob.STATUS_PENDING:
+                    job.status = AdminJob.STATUS_RUNNING
+                    job.started_at = timezone.now()
+                    job.total = queryset.count()
+                if job.last_pk is not None:
+                    queryset = queryset.filter(pk__gt=job.last_pk)
+                ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+                if ids:
+                    _, function = ACTIONS[job.action]
+                    function(ids, **job.params)
+                    job.processed += len(ids)
+                    job.last_pk = ids[-1]
+                if len(ids) < chunk_size:
+                    job.status = AdminJob.STATUS_DONE
+                    job.finished_at = timezone.now()
+        except Exception:
+            job.status = AdminJob.STATUS_FAILED
+            job.finished_at = timezone.now()
+            job.last_error = traceback.format_exc()
+        job.save()
+    return job
@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from store.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+# Moves orders placed before a horizon (settings.STORE_ORDER_ARCHIVE_AFTER) and their items
+# to store_archivedorder/store_archivedorderitem, keeping their ids. OrderViewSet falls back
+# to the archive when an id is no longer in store_order.
+
+
+def archive_orders(older_than=None, batch_size=500, pause=0.1, dry_run=False):
+    if older_than is None:
+        older_than = settings.STORE_ORDER_ARCHIVE_AFTER
+    # The newest order always stays, so an auto increment counter recomputed from MAX(id)
+    # (MySQL before 8.0 does this on restart) can't hand out an archived id again.
+    latest_id = Order.objects.aggregate(latest_id=Max('id'))['latest_id']
+    queryset = Order.objects \
+        .filter(placed_at__lt=timezone.now() - older_than) \
+        .exclude(id=latest_id) \
+        .order_by('id')
+
+    if dry_run:
+        return {
+            'orders': queryset.count(),
+            'items': OrderItem.objects.filter(order__in=queryset.values('id')).count(),
+        }
+
+    archived_orders = archived_items = 0
+    while True:
+        with transaction.atomic():
+            orders = list(queryset.select_for_update()[:batch_size])
+            if not orders:
+                break
+            order_ids = [order.id for order in orders]
+            items = list(OrderItem.objects.filter(order_id__in=order_ids))
+            ArchivedOrder.objects.bulk_create([
+                ArchivedOrder(
+                    id=order.id, placed_at=order.placed_at,
+                    payment_status=order.payment_status, customer_id=order.customer_id)
+                for order in orders
+            ])
+            ArchivedOrderItem.objects.bulk_create([
+                ArchivedOrderItem(
+                    id=item.id, order_id=item.order_id, product_id=item.product_id,
+                    quantity=item.quantity, unit_price=item.unit_price)
+                for item in items
+            ])
+            OrderItem.objects.filter(order_id__in=order_ids).delete()
+            Order.objects.filter(id__in=order_ids).delete()
+        archived_orders += len(orders)
+        archived_items += len(items)
+        if pause:
+            time.sleep(pause)
+    return {'orders': archived_orders, 'items': archived_items}
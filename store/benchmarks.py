@@ -0,0 +1,64 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.db import connection
+
+from store.models import Collection, Product
+
+# Helpers for the benchmark_* management commands. Concurrency numbers are only meaningful
+# on the production database (MySQL): SQLite serializes every write.
+
+
+def time_runs(function, repeat):
+    # Seconds taken by each of `repeat` calls
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_threads(function, threads):
+    # Calls function(thread_number) in `threads` threads started together and returns
+    # (results, seconds). Each thread closes its own database connection.
+    barrier = threading.Barrier(threads)
+
+    def run(number):
+        try:
+            barrier.wait()
+            return function(number)
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(run, range(threads)))
+    return results, time.perf_counter() - start
+
+
+def describe_timings(timings):
+    return f'median {statistics.median(timings) * 1000:.1f} ms, best {min(timings) * 1000:.1f} ms'
+
+
+def create_products(count, inventory=100):
+    # A collection of `count` products made for a benchmark. Returns (collection, product ids).
+    collection = Collection.objects.create(title='Benchmark')
+    Product.objects.bulk_create([
+        Product(title=f'Benchmark product {number}', slug=f'benchmark-{collection.id}-{number}',
+                unit_price=Decimal(10 + number % 90), effective_price=Decimal(10 + number % 90),
+                inventory=inventory, collection=collection)
+        for number in range(count)
+    ])
+    product_ids = list(Product.objects.filter(collection=collection).order_by('id').values_list('id', flat=True))
+    return collection, product_ids
+
+
+def delete_products(collection):
+    # Undoes create_products(). Deleted one by one so the Product signal handlers clean up after them.
+    for product in Product.objects.filter(collection=collection):
+        product.delete()
+    collection.delete()
@@ -0,0 +1,179 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+# Cached product responses are keyed on version counters instead of being deleted one by one.
+# Writes bump the counters of the scopes they affect (see store.signals.handlers), which
+# orphans every cached response built from the old versions.
+VERSION_KEY_PREFIX = 'store:version:'
+ALL_PRODUCTS = 'products'
+PROMOTIONS = 'promotions'
+
+
+def collection_scope(collection_id):
+    return f'collection:{collection_id}'
+
+
+def product_scope(product_id):
+    return f'product:{product_id}'
+
+
+def initial_version():
+    # Time based, so a counter evicted from the cache never restarts at a version that is still cached.
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes):
+    keys = [VERSION_KEY_PREFIX + scope for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, initial_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*scopes):
+    for scope in set(scopes):
+        key = VERSION_KEY_PREFIX + scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, initial_version(), None)
+
+
+def bump_versions_on_commit(*scopes):
+    # Bumped any earlier, a concurrent reader could cache the old rows under the new versions
+    transaction.on_commit(lambda: bump_versions(*scopes))
+
+
+def normalized_query_params(request):
+    return sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values if value != ''
+    )
+
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def set_validators(response, etag, last_modified=None):
+    if etag is not None:
+        response['ETag'] = quote_etag(etag)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def get_not_modified_response(request, etag, last_modified=None):
+    # 304 (or 412 for a failed If-Match) when the client's copy is current, otherwise None.
+    if etag is None and last_modified is None:
+        return None
+    response = get_conditional_response(
+        request, etag=etag and quote_etag(etag), last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+class CachedProductResponseMixin:
+    # Serves repeated ProductViewSet list/retrieve requests from the cache. List responses
+    # depend on the collection being filtered on (or on all products), detail responses on
+    # the product, and both on promotions.
+    # Responses carry an ETag derived from Product.last_update (detail responses also a
+    # Last-Modified), and conditional requests for an unchanged resource get a 304 before
+    # anything is serialized.
+    cache_timeout = getattr(settings, 'STORE_RESPONSE_CACHE_TIMEOUT', 300)
+
+    def list(self, request, *args, **kwargs):
+        collection_id = request.query_params.get('collection_id', '')
+        scope = collection_scope(collection_id) if collection_id.isdigit() else ALL_PRODUCTS
+        return self.cached_response(
+            'list', scope, super().list, self.get_list_validators, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        scope = product_scope(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        return self.cached_response(
+            'retrieve', scope, super().retrieve, self.get_detail_validators, request, *args, **kwargs)
+
+    def cached_response(self, action, scope, view, get_validators, request, *args, **kwargs):
+        versions = get_versions([scope, PROMOTIONS])
+        key = self.get_response_cache_key(request, action, scope, versions)
+        entry = cache.get(key)
+        if entry is not None:
+            data, etag, last_modified = entry
+        else:
+            data = None
+            etag, last_modified = get_validators(request, *args, **kwargs)
+
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        if data is not None:
+            response = Response(data)
+        else:
+            response = view(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cache.set(key, (response.data, etag, last_modified), self.cache_timeout)
+        return set_validators(response, etag, last_modified)
+
+    def get_list_validators(self, request, *args, **kwargs):
+        # One aggregate over the filtered set: any insert, update or delete changes MAX(last_update) or COUNT.
+        # No Last-Modified, as deleting a product other than the newest leaves MAX(last_update) as it was.
+        aggregate = self.filter_queryset(self.get_queryset()) \
+            .aggregate(last_update=Max('last_update'), count=Count('id'))
+        etag = make_etag(
+            request.get_host(), aggregate['last_update'], aggregate['count'], normalized_query_params(request))
+        return etag, None
+
+    def get_detail_validators(self, request, *args, **kwargs):
+        try:
+            last_update = self.get_queryset() \
+                .filter(pk=kwargs[self.lookup_url_kwarg or self.lookup_field]) \
+                .values_list('last_update', flat=True) \
+                .first()
+        except (TypeError, ValueError):
+            last_update = None
+        if last_update is None:
+            return None, None
+        etag = make_etag(request.get_host(), last_update, normalized_query_params(request))
+        return etag, int(last_update.timestamp())
+
+    def get_response_cache_key(self, request, action, scope, versions):
+        # Pagination links are absolute, so the host is part of the key.
+        raw_key = repr((request.get_host(), action, scope, versions, normalized_query_params(request)))
+        return 'store:products:' + hashlib.md5(raw_key.encode()).hexdigest()
+
+
+class VersionedETagMixin:
+    # ETags for CollectionViewSet taken straight from the version counters, so checking them costs no query.
+    # Product writes bump them too, which keeps products_count in the cached copy honest.
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response([ALL_PRODUCTS], super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        scope = collection_scope(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        return self.conditional_response([scope], super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, scopes, view, request, *args, **kwargs):
+        etag = make_etag(request.get_host(), get_versions(scopes), normalized_query_params(request))
+        not_modified = get_not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+        response = view(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            set_validators(response, etag)
+        return response
@@ -0,0 +1,284 @@
+import logging
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from uuid import UUID, uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from store.dbstats import average_row_size
+from store.models import Cart, CartItem, Product
+
+logger = logging.getLogger(__name__)
+
+# Cart storage engines, selected with settings.STORE_CART_BACKEND.
+#
+# DatabaseCartStore is the default: carts live in store_cart/store_cartitem and the
+# regular CartViewSet/CartItemViewSet work on them directly.
+#
+# CacheCartStore keeps cart state in the Django cache and writes it behind to the
+# database in batches (manage.py flush_carts). CreateOrderSerializer calls persist()
+# before reading a cart, so checkout always sees the latest state.
+# Requests only touch the cache: a cart is changed under a cache lock, and changed carts are
+# recorded in dirty sets in the cache, which a flush empties before writing the carts out.
+
+
+class DatabaseCartStore:
+    uses_database = True
+
+    def persist(self, cart_id):
+        pass
+
+    def discard(self, cart_id):
+        pass
+
+    def flush(self, batch_size=500):
+        return 0
+
+
+class CachedCart:
+    # Plain stand-in for Cart that CartSerializer and CartSummarySerializer can render,
+    # with the totals Cart.objects.with_totals() would annotate.
+    def __init__(self, id, created_at, items):
+        self.id = id
+        self.created_at = created_at
+        self.items = items
+        self.items_count = len(items)
+        self.total_quantity = sum(item.quantity for item in items)
+        self.total_price = sum(item.quantity * item.product.effective_price for item in items)
+
+
+class CartLocked(Exception):
+    pass
+
+
+@contextmanager
+def cache_lock(key, timeout=10, wait=5):
+    # Mutual exclusion through cache.add, which only one caller can win. The lock expires after
+    # `timeout` seconds in case its holder dies; CartLocked is raised after `wait` seconds.
+    token = uuid4().hex
+    deadline = time.monotonic() + wait
+    while not cache.add(key, token, timeout):
+        if time.monotonic() > deadline:
+            raise CartLocked(key)
+        time.sleep(0.005)
+    try:
+        yield
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+class CacheCartStore:
+    uses_database = False
+    key_prefix = 'store:cart:'
+    timeout = getattr(settings, 'STORE_CART_CACHE_TIMEOUT', 7 * 24 * 60 * 60)
+    # Dirty cart ids are spread over this many cache sets, each changed under its own lock
+    dirty_buckets = getattr(settings, 'STORE_CART_DIRTY_BUCKETS', 64)
+
+    def get_key(self, cart_id):
+        return f'{self.key_prefix}{cart_id}'
+
+    def get_dirty_key(self, bucket):
+        return f'{self.key_prefix}dirty:{bucket}'
+
+    def create(self):
+        state = {'id': str(uuid4()), 'created_at': timezone.now(), 'items': {}, 'deleted': False}
+        self.save(state)
+        return state
+
+    def get(self, cart_id):
+        try:
+            cart_id = str(UUID(str(cart_id)))
+        except ValueError:
+            return None
+        state = self.read(cart_id)
+        if state is None or state['deleted']:
+            return None
+        return state
+
+    def read(self, cart_id):
+        state = cache.get(self.get_key(cart_id))
+        if state is None:
+            state = self.load(cart_id)
+            if state is not None:
+                cache.set(self.get_key(cart_id), state, self.timeout)
+        return state
+
+    def load(self, cart_id):
+        cart = Cart.objects.filter(id=cart_id).first()
+        if cart is None:
+            return None
+        items = dict(CartItem.objects.filter(cart_id=cart_id).order_by('id').values_list('product_id', 'quantity'))
+        return {'id': cart_id, 'created_at': cart.created_at, 'items': items, 'deleted': False}
+
+    def save(self, state):
+        cache.set(self.get_key(state['id']), state, self.timeout)
+        self.mark_dirty([state['id']])
+
+    def change(self, state, function):
+        # Applies function(state) to the cart's latest state under the cart's lock, so concurrent
+        # changes to one cart never overwrite each other. `state` is updated in place.
+        with cache_lock(f'{self.get_key(state["id"])}:lock'):
+            current = self.read(state['id']) or state
+            function(current)
+            self.save(current)
+        state.clear()
+        state.update(current)
+
+    def delete(self, state):
+        def delete(current):
+            current['deleted'] = True
+            current['items'] = {}
+        self.change(state, delete)
+
+    def add_items(self, state, items):
+        def add_items(current):
+            for product_id, quantity in items:
+                current['items'][product_id] = current['items'].get(product_id, 0) + quantity
+        self.change(state, add_items)
+
+    def set_item_quantity(self, state, product_id, quantity):
+        def set_item_quantity(current):
+            current['items'][product_id] = quantity
+        self.change(state, set_item_quantity)
+
+    def remove_item(self, state, product_id):
+        def remove_item(current):
+            current['items'].pop(product_id, None)
+        self.change(state, remove_item)
+
+    def mark_dirty(self, cart_ids):
+        self.update_dirty(cart_ids, set.update)
+
+    def mark_clean(self, cart_ids):
+        self.update_dirty(cart_ids, set.difference_update)
+
+    def update_dirty(self, cart_ids, update):
+        buckets = {}
+        for cart_id in cart_ids:
+            bucket = UUID(str(cart_id)).int % self.dirty_buckets
+            buckets.setdefault(bucket, set()).add(str(cart_id))
+        for bucket, bucket_ids in buckets.items():
+            key = self.get_dirty_key(bucket)
+            with cache_lock(f'{key}:lock'):
+                dirty = cache.get(key, set())
+                update(dirty, bucket_ids)
+                cache.set(key, dirty, None)
+
+    def to_cart(self, state):
+        # Prices and titles always come from the products table.
+        products = Product.objects.only('id', 'title', 'unit_price', 'effective_price').in_bulk(list(state['items']))
+        items = [
+            CartItem(id=product_id, cart_id=state['id'], product=products[product_id], quantity=quantity)
+            for product_id, quantity in state['items'].items()
+            if product_id in products
+        ]
+        return CachedCart(state['id'], state['created_at'], items)
+
+    def persist(self, cart_id):
+        # The cart stays dirty, so the next flush writes it again
+        self.flush_carts([str(cart_id)])
+
+    def discard(self, cart_id):
+        cache.delete(self.get_key(cart_id))
+        self.mark_clean([cart_id])
+
+    def flush(self, batch_size=500):
+        flushed = 0
+        for bucket in range(self.dirty_buckets):
+            key = self.get_dirty_key(bucket)
+            # Carts changed from here on are marked dirty again and flushed next time
+            with cache_lock(f'{key}:lock'):
+                cart_ids = sorted(cache.get(key, set()))
+                cache.delete(key)
+            for start in range(0, len(cart_ids), batch_size):
+                try:
+                    evicted = self.flush_carts(cart_ids[start:start + batch_size])
+                except Exception:
+                    self.mark_dirty(cart_ids[start:])
+                    raise
+                if evicted:
+                    # The database keeps these carts as of their last flush
+                    logger.warning('Carts evicted from the cache before they were flushed, '
+                                   'their latest changes are lost: %s', ', '.join(evicted))
+            flushed += len(cart_ids)
+        return flushed
+
+    def flush_carts(self, cart_ids):
+        # Writes the carts' cached state and returns the ids no longer in the cache
+        found = cache.get_many([self.get_key(cart_id) for cart_id in cart_ids])
+        states = list(found.values())
+        self.write_states(states)
+        cache.delete_many([self.get_key(state['id']) for state in states if state['deleted']])
+        return [cart_id for cart_id in cart_ids if self.get_key(cart_id) not in found]
+
+    def write_states(self, states):
+        deleted_ids = [state['id'] for state in states if state['deleted']]
+        live_states = [state for state in states if not state['deleted']]
+        live_ids = [state['id'] for state in live_states]
+        # Products deleted while the cart sat in the cache are dropped
+        product_ids = {product_id for state in live_states for product_id in state['items']}
+        existing_ids = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+
+        with transaction.atomic():
+            Cart.objects.filter(id__in=deleted_ids).delete()
+            # created_at is auto_now_add, so new rows get the flush time rather than the
+            # time the cart was created in the cache (off by at most one flush interval).
+            Cart.objects.bulk_create(
+                [Cart(id=state['id'], created_at=state['created_at']) for state in live_states],
+                ignore_conflicts=True)
+            CartItem.objects.filter(cart_id__in=live_ids).delete()
+            CartItem.objects.bulk_create([
+                CartItem(cart_id=state['id'], product_id=product_id, quantity=quantity)
+                for state in live_states
+                for product_id, quantity in state['items'].items()
+                if product_id in existing_ids
+            ])
+
+
+def get_cart_store():
+    backend = getattr(settings, 'STORE_CART_BACKEND', 'store.carts.DatabaseCartStore')
+    return import_string(backend)()
+
+
+def sweep_abandoned_carts(ttl=None, batch_size=500, pause=0.1, dry_run=False):
+    # Deletes carts created more than `ttl` ago (settings.STORE_CART_TTL by default), with their items,
+    # in batches of `batch_size` carts picked from the created_at index. Each batch is its own short
+    # transaction, followed by a `pause` in seconds so the sweep never holds locks for long.
+    # Returns the carts and items deleted (or that would be, for a dry run) and an estimate of the
+    # bytes reclaimed from table statistics, None where the database doesn't keep them.
+    if ttl is None:
+        ttl = getattr(settings, 'STORE_CART_TTL', timedelta(days=30))
+    abandoned = Cart.objects.filter(created_at__lt=timezone.now() - ttl)
+    store = get_cart_store()
+
+    if dry_run:
+        carts = abandoned.count()
+        items = CartItem.objects.filter(cart__in=abandoned).count()
+    else:
+        carts = items = 0
+        while True:
+            cart_ids = list(abandoned.order_by('created_at').values_list('id', flat=True)[:batch_size])
+            if not cart_ids:
+                break
+            with transaction.atomic():
+                deleted, per_model = Cart.objects.filter(id__in=cart_ids).delete()
+            # Otherwise a write-behind store would flush them back
+            for cart_id in cart_ids:
+                store.discard(cart_id)
+            carts += per_model.get(Cart._meta.label, 0)
+            items += per_model.get(CartItem._meta.label, 0)
+            if pause:
+                time.sleep(pause)
+
+    cart_size = average_row_size(Cart)
+    item_size = average_row_size(CartItem)
+    reclaimed = None
+    if cart_size is not None and item_size is not None:
+        reclaimed = carts * cart_size + items * item_size
+    return {'carts': carts, 'items': items, 'bytes': reclaimed}
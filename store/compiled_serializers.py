@@ -0,0 +1,112 @@
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField, RelatedField
+from rest_framework.response import Response
+from rest_framework.utils.serializer_helpers import ReturnList
+
+# Read-only fast path for list endpoints. A serializer is "compiled" once per request into
+# values() lookups plus one getter per output field, and rows are turned into plain dicts
+# without instantiating models or going through Serializer.to_representation.
+# Field values still go through each field's own to_representation, and SerializerMethodFields
+# are replaced by the row functions the serializer declares in `compiled_methods`, so the
+# output is identical to the regular serializer.
+
+
+class NotCompilable(Exception):
+    pass
+
+
+def _value_getter(key, field):
+    to_representation = field.to_representation
+
+    def get(row):
+        value = row[key]
+        return None if value is None else to_representation(value)
+    return get
+
+
+def _raw_getter(key):
+    def get(row):
+        return row[key]
+    return get
+
+
+def _method_getter(keys, function):
+    def get(row):
+        return function(*[row[key] for key in keys])
+    return get
+
+
+def _nested_getter(plan):
+    def get(row):
+        return {name: getter(row) for name, getter in plan}
+    return get
+
+
+def compile_serializer(serializer, prefix=''):
+    lookups = []
+    plan = []
+    methods = getattr(serializer, 'compiled_methods', {})
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in methods:
+            field_lookups, function = methods[name]
+            keys = [prefix + lookup for lookup in field_lookups]
+            lookups += keys
+            plan.append((name, _method_getter(keys, function)))
+            continue
+        if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+            raise NotCompilable(name)
+
+        key = prefix + '__'.join(field.source_attrs)
+        if isinstance(field, serializers.ListSerializer):
+            raise NotCompilable(name)
+        elif isinstance(field, serializers.BaseSerializer):
+            nested_lookups, nested_plan = compile_serializer(field, key + '__')
+            lookups += nested_lookups
+            plan.append((name, _nested_getter(nested_plan)))
+        elif isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+            # values() already returns the primary key of the related row
+            lookups.append(key)
+            plan.append((name, _raw_getter(key)))
+        elif isinstance(field, RelatedField):
+            raise NotCompilable(name)
+        else:
+            lookups.append(key)
+            plan.append((name, _value_getter(key, field)))
+    return list(dict.fromkeys(lookups)), plan
+
+
+class CompiledSerializer:
+    def __init__(self, serializer):
+        self.serializer = serializer
+        self.lookups, self.plan = compile_serializer(serializer)
+
+    def get_queryset(self, queryset):
+        # Annotations (e.g. search_rank) stay selected, as the paginator may order on them.
+        return queryset.values(*self.lookups, *queryset.query.annotations)
+
+    def to_representation(self, rows):
+        plan = self.plan
+        return ReturnList(
+            [{name: getter(row) for name, getter in plan} for row in rows],
+            serializer=self.serializer.parent or self.serializer)
+
+
+class CompiledListMixin:
+    # Serves list() through CompiledSerializer when every field of the (possibly sparse)
+    # serializer can be compiled, and falls back to the regular serializer otherwise.
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer(many=True)
+        try:
+            compiled = CompiledSerializer(serializer.child)
+        except NotCompilable:
+            return super().list(request, *args, **kwargs)
+
+        queryset = compiled.get_queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(compiled.to_representation(page))
+        return Response(compiled.to_representation(queryset))
+
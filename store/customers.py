@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from store.models import Customer
+
+# Resolves the Customer of a user. Ids and profiles are cached by user id; the Customer and
+# User signal handlers in store.signals.handlers forget the entries when either changes.
+# The request helpers also memoize the result for the rest of the request, and use the
+# customer_id claim of JWT authenticated users (core.authentication) when there is one.
+CUSTOMER_CACHE_TIMEOUT = getattr(settings, 'STORE_CUSTOMER_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def customer_id_key(user_id):
+    return f'store:customer-id:{user_id}'
+
+
+def customer_key(user_id):
+    return f'store:customer:{user_id}'
+
+
+def get_customer_id(user_id):
+    key = customer_id_key(user_id)
+    customer_id = cache.get(key)
+    if customer_id is None:
+        customer_id = Customer.objects.values_list('id', flat=True).get(user_id=user_id)
+        cache.set(key, customer_id, CUSTOMER_CACHE_TIMEOUT)
+    return customer_id
+
+
+def get_customer(user_id):
+    key = customer_key(user_id)
+    customer = cache.get(key)
+    if customer is None:
+        customer = Customer.objects.get(user_id=user_id)
+        cache.set(key, customer, CUSTOMER_CACHE_TIMEOUT)
+    return customer
+
+
+def forget_customer(user_id):
+    cache.delete_many([customer_id_key(user_id), customer_key(user_id)])
+
+
+def get_request_customer_id(request):
+    if not hasattr(request, '_customer_id'):
+        customer_id = getattr(request.user, 'customer_id', None)
+        if customer_id is None:
+            customer_id = get_customer_id(request.user.id)
+        request._customer_id = customer_id
+    return request._customer_id
+
+
+def get_request_customer(request):
+    if not hasattr(request, '_customer'):
+        request._customer = get_customer(request.user.id)
+    return request._customer
@@ -0,0 +1,49 @@
+from django.db import connections
+
+
+def estimated_row_count(model, using='default'):
+    # Row estimate from the database's table statistics. Returns None where the backend has none (e.g. SQLite).
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s', [table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def average_row_size(model, using='default'):
+    # Average bytes per row (data only) from the table statistics, or None where the backend has none.
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT AVG_ROW_LENGTH FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s', [table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT pg_relation_size(oid) / NULLIF(reltuples, 0) FROM pg_class WHERE relname = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] <= 0:
+        return None
+    return int(row[0])
+
+
+def approximate_count(queryset, cap=10000):
+    # Unfiltered querysets are answered from table statistics, filtered ones are counted up to `cap` rows.
+    if not queryset.query.where:
+        estimate = estimated_row_count(queryset.model, queryset.db)
+        if estimate is not None:
+            return estimate
+    return queryset.order_by().values('pk')[:cap].count()
@@ -0,0 +1,79 @@
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+ORDER_FIELDS = ['id', 'placed_at', 'payment_status', 'customer_id']
+ORDER_ITEM_FIELDS = ['id', 'order_id', 'product_id', 'quantity', 'unit_price']
+CSV_HEADER = ['order_id', 'placed_at', 'payment_status', 'customer_id', 'item_id', 'product_id', 'quantity', 'unit_price']
+
+
+def iter_order_chunks(orders, chunk_size=2000):
+    # Walks the orders by primary key in chunks (keyset, not OFFSET) and fetches each
+    # chunk's items with one query, so memory stays flat however many orders there are.
+    # MySQL drivers buffer whole result sets, which rules out one big iterator() here.
+    # `orders` may be Order or ArchivedOrder rows; both reach their items through orderitem_set.
+    item_model = orders.model.orderitem_set.rel.related_model
+    orders = orders.order_by('id').values(*ORDER_FIELDS)
+    last_id = 0
+    while True:
+        chunk = list(orders.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        last_id = chunk[-1]['id']
+        items = {order['id']: [] for order in chunk}
+        order_items = item_model.objects \
+            .filter(order_id__in=items) \
+            .order_by('order_id', 'id') \
+            .values(*ORDER_ITEM_FIELDS) \
+            .iterator(chunk_size=chunk_size)
+        for item in order_items:
+            items[item['order_id']].append(item)
+        yield [(order, items[order['id']]) for order in chunk]
+
+
+def iter_order_sources(order_querysets, chunk_size):
+    # Exports cover the archive (store.archive) as well as store_order, one table after the other
+    for orders in order_querysets:
+        yield from iter_order_chunks(orders, chunk_size)
+
+
+def export_orders_ndjson(order_querysets, chunk_size=2000):
+    encoder = DjangoJSONEncoder()
+    for chunk in iter_order_sources(order_querysets, chunk_size):
+        lines = []
+        for order, items in chunk:
+            lines.append(encoder.encode({
+                'id': order['id'],
+                'placed_at': order['placed_at'],
+                'payment_status': order['payment_status'],
+                'customer': order['customer_id'],
+                'items': [{
+                    'id': item['id'],
+                    'product': item['product_id'],
+                    'quantity': item['quantity'],
+                    'unit_price': item['unit_price'],
+                } for item in items],
+            }))
+        yield '\n'.join(lines) + '\n'
+
+
+def export_orders_csv(order_querysets, chunk_size=2000):
+    # One line per order item
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for chunk in iter_order_sources(order_querysets, chunk_size):
+        for order, items in chunk:
+            for item in items:
+                writer.writerow([
+                    order['id'], order['placed_at'].isoformat(), order['payment_status'], order['customer_id'],
+                    item['id'], item['product_id'], item['quantity'], item['unit_price'],
+                ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,83 @@
+from rest_framework.permissions import SAFE_METHODS
+
+
+class SparseFieldsetMixin:
+    # ?fields=id,title keeps only the listed serializer fields and ?omit=description drops fields.
+    # Model columns that no remaining field reads are deferred, so they aren't even fetched.
+    # Serializers declare what their SerializerMethodFields read in `field_dependencies`.
+    # Without an entry, such a field counts as reading the whole object and nothing is deferred.
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+
+    def get_query_param_list(self, name):
+        value = self.request.query_params.get(name, '')
+        return {item.strip() for item in value.split(',') if item.strip()}
+
+    def get_sparse_fieldset(self, field_names):
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            return None
+        fields = self.get_query_param_list(self.fields_query_param)
+        omit = self.get_query_param_list(self.omit_query_param)
+        if not fields and not omit:
+            return None
+        return [name for name in field_names if (not fields or name in fields) and name not in omit]
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        target = getattr(serializer, 'child', serializer)
+        selected = self.get_sparse_fieldset(list(target.fields))
+        if selected is not None:
+            for name in list(target.fields):
+                if name not in selected:
+                    target.fields.pop(name)
+        return serializer
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        deferred = self.get_deferred_columns(queryset)
+        if deferred:
+            queryset = queryset.defer(*deferred)
+        return queryset
+
+    def get_deferred_columns(self, queryset):
+        serializer_class = self.get_serializer_class()
+        fields = serializer_class().fields
+        selected = self.get_sparse_fieldset(list(fields))
+        if selected is None:
+            return []
+
+        dependencies = getattr(serializer_class, 'field_dependencies', {})
+        needed = set(self.get_ordering_columns())
+        for name in selected:
+            if name in dependencies:
+                needed.update(dependencies[name])
+            elif fields[name].source == '*':
+                return []
+            else:
+                needed.add(fields[name].source.split('.')[0])
+
+        # Relations traversed by select_related/prefetch_related can't be deferred.
+        select_related = queryset.query.select_related
+        related = set(select_related) if isinstance(select_related, dict) else set()
+        related.update(lookup.split('__')[0] for lookup in queryset._prefetch_related_lookups
+                       if isinstance(lookup, str))
+        if select_related is True:
+            return []
+
+        return [
+            field.name for field in queryset.model._meta.concrete_fields
+            if not field.primary_key
+            and field.name not in needed
+            and field.attname not in needed
+            and field.name not in related
+        ]
+
+    def get_ordering_columns(self):
+        # The paginator reads the ordering columns from the page to build its cursors.
+        ordering = list(getattr(self, 'ordering', None) or [])
+        ordering += self.get_query_param_list('ordering')
+        paginator_ordering = getattr(self.paginator, 'ordering', None) or []
+        if isinstance(paginator_ordering, str):
+            paginator_ordering = [paginator_ordering]
+        ordering += list(paginator_ordering)
+        return [order.lstrip('-') for order in ordering]
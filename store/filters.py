@@ -1,10 +1,49 @@
 from django_filters.rest_framework import FilterSet
-from .models import Product
+from rest_framework.filters import SearchFilter
+from .models import CollectionSalesRollup, Order, Product, ProductSalesRollup
+from .search import get_search_backend
 
 class ProductFilter(FilterSet):
     class Meta:
         model = Product
         fields = {
             'collection_id': ['exact'],
-            'unit_price' : ['gt','lt']
-        }
\ No newline at end of file
+            'unit_price' : ['gt','lt'],
+            'effective_price' : ['gt','lt']
+        }
+
+
+class OrderFilter(FilterSet):
+    class Meta:
+        model = Order
+        fields = {
+            'placed_at': ['gte', 'lt'],
+        }
+
+
+class ProductSalesRollupFilter(FilterSet):
+    class Meta:
+        model = ProductSalesRollup
+        fields = {
+            'date': ['gte', 'lte'],
+            'payment_status': ['exact'],
+            'product__collection_id': ['exact'],
+        }
+
+
+class CollectionSalesRollupFilter(FilterSet):
+    class Meta:
+        model = CollectionSalesRollup
+        fields = {
+            'date': ['gte', 'lte'],
+            'payment_status': ['exact'],
+        }
+
+
+class ProductSearchFilter(SearchFilter):
+    # Delegates ?search= to the configured search backend (see store.search) instead of LIKE '%term%' scans.
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return get_search_backend().search(queryset, query)
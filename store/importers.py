@@ -0,0 +1,139 @@
+import csv
+import json
+import logging
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from store.models import Collection, Product
+from store.signals import products_bulk_updated
+
+logger = logging.getLogger(__name__)
+
+
+class ProductImportSerializer(serializers.ModelSerializer):
+    # The collection is checked against ids loaded once per import instead of one query per row.
+    collection = serializers.IntegerField()
+
+    class Meta:
+        model = Product
+        fields = ['title', 'description', 'unit_price', 'inventory', 'collection']
+
+    def validate_collection(self, value):
+        if value not in self.context['collection_ids']:
+            raise serializers.ValidationError('No collection with the given ID exists')
+        return value
+
+
+def read_csv_rows(lines):
+    return csv.DictReader(lines)
+
+
+def read_ndjson_rows(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+class ProductImporter:
+    # Upserts products by slug from an iterable of rows, chunk by chunk, so memory use
+    # doesn't depend on the size of the input. Each chunk is written in its own short
+    # transaction with one bulk_update and one bulk_create.
+    update_fields = ['title', 'description', 'unit_price', 'inventory', 'collection', 'last_update']
+
+    def __init__(self, chunk_size=500, max_errors=1000):
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+        self.collection_ids = set(Collection.objects.values_list('id', flat=True))
+
+    def run(self, rows):
+        rows = enumerate(rows, start=1)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+        return self.report()
+
+    def report(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+    def add_error(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def import_chunk(self, chunk):
+        products_by_slug = {}
+        for row_number, row in chunk:
+            if not isinstance(row, dict):
+                self.add_error(row_number, {'non_field_errors': ['Invalid row']})
+                continue
+            serializer = ProductImportSerializer(data=row, context={'collection_ids': self.collection_ids})
+            if not serializer.is_valid():
+                self.add_error(row_number, serializer.errors)
+                continue
+            data = serializer.validated_data
+            # Same slug as ProductSerializer.create; a later row with the same slug wins.
+            slug = data['title'].replace(' ', '-')
+            products_by_slug[slug] = Product(
+                slug=slug,
+                title=data['title'],
+                description=data.get('description'),
+                unit_price=data['unit_price'],
+                inventory=data['inventory'],
+                collection_id=data['collection'])
+        if not products_by_slug:
+            return
+
+        now = timezone.now()
+        collection_ids = set()
+        with transaction.atomic():
+            existing = {
+                product.slug: product
+                for product in Product.objects.filter(slug__in=products_by_slug).only('id', 'slug', 'collection_id')
+            }
+            to_update = []
+            to_create = []
+            for slug, product in products_by_slug.items():
+                if slug in existing:
+                    collection_ids.add(existing[slug].collection_id)
+                    product.id = existing[slug].id
+                    product.last_update = now
+                    to_update.append(product)
+                else:
+                    # New products have no promotions yet
+                    product.effective_price = product.unit_price
+                    to_create.append(product)
+                collection_ids.add(product.collection_id)
+            Product.objects.bulk_update(to_update, self.update_fields, batch_size=self.chunk_size)
+            Product.objects.bulk_create(to_create, batch_size=self.chunk_size)
+
+        self.created += len(to_create)
+        self.updated += len(to_update)
+        # bulk_create doesn't return primary keys on every database, so look them up by slug.
+        product_ids = [product.id for product in to_update] + list(
+            Product.objects.filter(slug__in=[product.slug for product in to_create]).values_list('id', flat=True))
+        # The chunk is in; a failing receiver (prices, search index, cache versions) is logged
+        # rather than failing the rest of the import.
+        responses = products_bulk_updated.send_robust(
+            sender=self.__class__, product_ids=product_ids, collection_ids=collection_ids)
+        for receiver, response in responses:
+            if isinstance(response, Exception):
+                logger.error('products_bulk_updated receiver %s failed after a product import',
+                             receiver.__qualname__, exc_info=response)
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from store.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Moves orders older than settings.STORE_ORDER_ARCHIVE_AFTER (or --days) to the archive tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, help='Archive orders placed more than DAYS days ago.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.1, help='Seconds to sleep between batches.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived.')
+
+    def handle(self, *args, **options):
+        older_than = timedelta(days=options['days']) if options['days'] is not None else None
+        result = archive_orders(
+            older_than, batch_size=options['batch_size'], pause=options['pause'], dry_run=options['dry_run'])
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {result["orders"]} orders and {result["items"]} items.'))
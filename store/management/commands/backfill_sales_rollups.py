@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from store import rollups
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the sales rollup tables from all live and archived orders. '
+            'Run it with `process_outbox` drained and stopped, so no order is counted twice.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        orders = rollups.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt sales rollups from {orders} orders.'))
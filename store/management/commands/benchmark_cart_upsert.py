@@ -0,0 +1,72 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+from django.db.models import Sum
+
+from store.benchmarks import create_products, delete_products, run_threads
+from store.models import Cart, CartItem
+
+
+def add_item_read_then_write(cart_id, product_id, quantity):
+    # How AddCartItemSerializer.save() added an item before CartItemManager.add_items()
+    try:
+        cart_item = CartItem.objects.get(cart_id=cart_id, product_id=product_id)
+        cart_item.quantity += quantity
+        cart_item.save()
+    except CartItem.DoesNotExist:
+        CartItem.objects.create(cart_id=cart_id, product_id=product_id, quantity=quantity)
+
+
+def add_item_upsert(cart_id, product_id, quantity):
+    CartItem.objects.add_items(cart_id, [(product_id, quantity)])
+
+
+class Command(BaseCommand):
+    help = ('Adds items to one cart from concurrent threads, with the old read-then-write path and with '
+            'the single-statement upsert (CartItemManager.add_items), and reports throughput, errors and '
+            'lost updates. Run it against the production database; SQLite serializes every write.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--adds', type=int, default=200, help='Items added by each thread.')
+        parser.add_argument('--products', type=int, default=5,
+                            help='Distinct products the threads add; fewer means more contention.')
+
+    def handle(self, *args, **options):
+        collection, product_ids = create_products(options['products'])
+        carts = []
+        try:
+            for name, add_item in [('read-then-write', add_item_read_then_write), ('upsert', add_item_upsert)]:
+                cart = Cart.objects.create()
+                carts.append(cart)
+                self.run(name, add_item, cart.id, product_ids, options['threads'], options['adds'])
+        finally:
+            Cart.objects.filter(id__in=[cart.id for cart in carts]).delete()
+            delete_products(collection)
+
+    def run(self, name, add_item, cart_id, product_ids, threads, adds):
+        def add_items(number):
+            added = 0
+            errors = Counter()
+            for index in range(adds):
+                product_id = product_ids[(number + index) % len(product_ids)]
+                try:
+                    add_item(cart_id, product_id, 1)
+                    added += 1
+                except DatabaseError as error:
+                    errors[type(error).__name__] += 1
+            return added, errors
+
+        results, seconds = run_threads(add_items, threads)
+        added = sum(added for added, _ in results)
+        errors = sum((errors for _, errors in results), Counter())
+        quantity = CartItem.objects.filter(cart_id=cart_id).aggregate(quantity=Sum('quantity'))['quantity'] or 0
+
+        self.stdout.write(f'{name}: {threads * adds} adds from {threads} threads in {seconds:.2f} s, '
+                          f'{threads * adds / seconds:.0f} adds/s')
+        self.stdout.write(f'  failed: {sum(errors.values())} '
+                          f'({", ".join(f"{count} {error}" for error, count in errors.items()) or "none"})')
+        lost = added - quantity
+        style = self.style.SUCCESS if lost == 0 and not errors else self.style.ERROR
+        self.stdout.write(style(f'  lost updates: {lost} (quantity {quantity} for {added} successful adds)'))
@@ -0,0 +1,106 @@
+from collections import Counter
+from contextlib import nullcontext
+from types import SimpleNamespace
+from unittest import mock
+from uuid import uuid4
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from store.benchmarks import create_products, delete_products, run_threads
+from store.models import Cart, CartItem, Customer, InsufficientInventory, Order, OrderItem, OutboxMessage, Product, ProductManager
+from store.serializers import CreateOrderSerializer
+
+
+def reserve_inventory_locking(manager, quantities):
+    # Read-check-write under SELECT ... FOR UPDATE, the usual alternative to
+    # ProductManager.reserve_inventory's single conditional UPDATE
+    with transaction.atomic(using=manager.db):
+        products = list(manager.select_for_update().filter(id__in=quantities).order_by('id').only('id', 'inventory'))
+        short = [product.id for product in products if product.inventory < quantities[product.id]]
+        if short or len(products) < len(quantities):
+            raise InsufficientInventory(short)
+        for product in products:
+            manager.filter(id=product.id).update(
+                inventory=F('inventory') - quantities[product.id], last_update=timezone.now())
+
+
+class Command(BaseCommand):
+    help = ('Places concurrent checkouts of one hot product through CreateOrderSerializer, reserving stock '
+            'with a locking read-check-write and with the conditional UPDATE '
+            '(ProductManager.reserve_inventory), and reports throughput and oversold units. '
+            'Run it against the production database; SQLite serializes every write.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--checkouts', type=int, default=50, help='Checkouts placed by each thread.')
+        parser.add_argument('--inventory', type=int,
+                            help='Units in stock at the start (default: one per checkout).')
+
+    def handle(self, *args, **options):
+        total = options['threads'] * options['checkouts']
+        inventory = total if options['inventory'] is None else options['inventory']
+        collection, (product_id,) = create_products(1)
+        username = f'benchmark-{uuid4().hex}'
+        user = get_user_model().objects.create_user(username=username, email=f'{username}@example.com')
+        customer_id = Customer.objects.values_list('id', flat=True).get(user=user)
+        request = SimpleNamespace(user=SimpleNamespace(id=user.id, customer_id=customer_id))
+        strategies = [
+            ('locking read-check-write', mock.patch.object(ProductManager, 'reserve_inventory', reserve_inventory_locking)),
+            ('conditional update', nullcontext()),
+        ]
+        try:
+            for name, strategy in strategies:
+                Product.objects.filter(id=product_id).update(inventory=inventory)
+                cart_ids = []
+                for _ in range(total):
+                    cart = Cart.objects.create()
+                    CartItem.objects.add_items(cart.id, [(product_id, 1)])
+                    cart_ids.append(cart.id)
+                with strategy:
+                    self.run(name, request, product_id, inventory, cart_ids, options['threads'])
+        finally:
+            order_ids = list(Order.objects.filter(customer_id=customer_id).values_list('id', flat=True))
+            OutboxMessage.objects.filter(event='order_created', payload__order__pk__in=order_ids).delete()
+            OrderItem.objects.filter(order_id__in=order_ids).delete()
+            Order.objects.filter(id__in=order_ids).delete()
+            Cart.objects.filter(items__product_id=product_id).delete()
+            user.delete()
+            delete_products(collection)
+
+    def run(self, name, request, product_id, inventory, cart_ids, threads):
+        def checkout(number):
+            sold = 0
+            rejected = 0
+            errors = Counter()
+            for cart_id in cart_ids[number::threads]:
+                serializer = CreateOrderSerializer(data={'cart_id': cart_id}, context={'request': request})
+                try:
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save()
+                    sold += 1
+                except ValidationError:
+                    rejected += 1
+                except DatabaseError as error:
+                    errors[type(error).__name__] += 1
+            return sold, rejected, errors
+
+        results, seconds = run_threads(checkout, threads)
+        sold = sum(sold for sold, _, _ in results)
+        rejected = sum(rejected for _, rejected, _ in results)
+        errors = sum((errors for _, _, errors in results), Counter())
+        left = Product.objects.values_list('inventory', flat=True).get(id=product_id)
+
+        self.stdout.write(f'{name}: {len(cart_ids)} checkouts from {threads} threads in {seconds:.2f} s, '
+                          f'{len(cart_ids) / seconds:.0f} checkouts/s')
+        self.stdout.write(f'  sold: {sold}, out of stock: {rejected}, failed: {sum(errors.values())} '
+                          f'({", ".join(f"{count} {error}" for error, count in errors.items()) or "none"})')
+        oversold = sold - inventory
+        consistent = left == inventory - sold
+        style = self.style.SUCCESS if oversold <= 0 and consistent else self.style.ERROR
+        self.stdout.write(style(f'  oversold: {max(oversold, 0)}, inventory left: {left} '
+                                f'({"matches" if consistent else "does not match"} the units sold)'))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from store.benchmarks import create_products, describe_timings, time_runs
+from store.compiled_serializers import CompiledSerializer
+from store.models import Cart, CartItem, Product
+from store.serializers import CartItemSerializer, ProductSerializer
+
+
+class Command(BaseCommand):
+    help = ('Times the product and cart item list serializers against their compiled values() path '
+            '(store.compiled_serializers). The rows are created in a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            collection, product_ids = create_products(options['rows'])
+            cart = Cart.objects.create()
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, product_id=product_id, quantity=1) for product_id in product_ids])
+
+            benchmarks = [
+                ('Products', ProductSerializer, Product.objects.filter(collection=collection)),
+                ('Cart items', CartItemSerializer,
+                 CartItem.objects.with_total_price().select_related('product').filter(cart=cart)),
+            ]
+            for name, serializer_class, queryset in benchmarks:
+                self.compare(name, serializer_class, queryset, options['repeat'])
+            transaction.set_rollback(True)
+
+    def compare(self, name, serializer_class, queryset, repeat):
+        def serialize():
+            return serializer_class(queryset.all(), many=True).data
+
+        def serialize_compiled():
+            compiled = CompiledSerializer(serializer_class(many=True).child)
+            return compiled.to_representation(compiled.get_queryset(queryset.all()))
+
+        if serialize() != serialize_compiled():
+            raise CommandError(f'{name}: the compiled path returned different data')
+
+        timings = time_runs(serialize, repeat)
+        compiled_timings = time_runs(serialize_compiled, repeat)
+        speedup = min(timings) / min(compiled_timings)
+        self.stdout.write(f'{name} ({queryset.count()} rows, {repeat} runs)')
+        self.stdout.write(f'  serializer: {describe_timings(timings)}')
+        self.stdout.write(f'  compiled:   {describe_timings(compiled_timings)}')
+        self.stdout.write(self.style.SUCCESS(f'  {speedup:.1f}x faster, same output'))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.carts import get_cart_store
+
+
+class Command(BaseCommand):
+    help = 'Writes carts changed in a write-behind cart store (STORE_CART_BACKEND) to the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and flush every INTERVAL seconds.')
+
+    def handle(self, *args, **options):
+        store = get_cart_store()
+        while True:
+            flushed = store.flush(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Flushed {flushed} carts.'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,32 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from store.outbox import process_batch, purge_processed
+
+
+class Command(BaseCommand):
+    help = 'Sends the signals queued in the transactional outbox (store.outbox).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and poll every INTERVAL seconds once the outbox is drained.')
+        parser.add_argument('--purge-days', type=float, default=7,
+                            help='Delete messages processed more than PURGE_DAYS days ago.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = failed = 0
+            while True:
+                messages = process_batch(options['batch_size'])
+                sent += sum(1 for message in messages if message.processed_at)
+                failed += sum(1 for message in messages if not message.processed_at)
+                if len(messages) < options['batch_size']:
+                    break
+            purged = purge_processed(timedelta(days=options['purge_days']))
+            self.stdout.write(self.style.SUCCESS(f'Sent {sent} messages, {failed} failed, {purged} purged.'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from store.models import Collection
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized Collection.products_count column.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('collection_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        collection_ids = options['collection_ids'] or None
+        updated = Collection.objects.refresh_products_count(collection_ids)
+        self.stdout.write(self.style.SUCCESS(f'Refreshed products_count for {updated} collections.'))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.admin_jobs import run_chunk
+from store.models import AdminJob
+
+
+class Command(BaseCommand):
+    help = 'Runs the bulk admin actions queued from the admin (store.admin_jobs), chunk by chunk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.1, help='Seconds to sleep between chunks.')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and poll every INTERVAL seconds once no job is left.')
+
+    def handle(self, *args, **options):
+        while True:
+            while True:
+                job = run_chunk(options['chunk_size'])
+                if job is None:
+                    break
+                if job.status == AdminJob.STATUS_DONE:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'Job {job.id} ({job.action}) done, {job.processed} rows.'))
+                elif job.status == AdminJob.STATUS_FAILED:
+                    self.stderr.write(f'Job {job.id} ({job.action}) failed:\n{job.last_error}')
+                if options['pause']:
+                    time.sleep(options['pause'])
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from store.carts import sweep_abandoned_carts
+
+
+class Command(BaseCommand):
+    help = 'Deletes carts older than a TTL (settings.STORE_CART_TTL by default) in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, help='Delete carts created more than DAYS days ago.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.1, help='Seconds to sleep between batches.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted.')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and sweep every INTERVAL seconds.')
+
+    def handle(self, *args, **options):
+        ttl = timedelta(days=options['days']) if options['days'] is not None else None
+        while True:
+            result = sweep_abandoned_carts(
+                ttl, batch_size=options['batch_size'], pause=options['pause'], dry_run=options['dry_run'])
+            reclaimed = 'size unknown' if result['bytes'] is None else f'~{result["bytes"]} bytes'
+            verb = 'Would delete' if options['dry_run'] else 'Deleted'
+            self.stdout.write(self.style.SUCCESS(
+                f'{verb} {result["carts"]} carts and {result["items"]} items ({reclaimed}).'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
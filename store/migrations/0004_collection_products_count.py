@@ -0,0 +1,28 @@
+# Generated by Django 3.2 on 2026-10-17 00:06
+
+from django.db import migrations, models
+
+
+def populate_products_count(apps, schema_editor):
+    Collection = apps.get_model('store', 'Collection')
+    collections = list(
+        Collection.objects.annotate(actual_products_count=models.Count('products')).only('id'))
+    for collection in collections:
+        collection.products_count = collection.actual_products_count
+    Collection.objects.bulk_update(collections, ['products_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_alter_order_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_products_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+# Native full-text indexes used by store.search.SQLiteFTS5Backend and
+# store.search.MySQLFulltextBackend. Other databases only get the built-in inverted index.
+
+def create_native_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS store_product_fts USING fts5(title, description)')
+        schema_editor.execute(
+            'INSERT INTO store_product_fts (rowid, title, description) '
+            'SELECT id, title, description FROM store_product')
+    elif connection.vendor == 'mysql':
+        schema_editor.execute(
+            'ALTER TABLE store_product ADD FULLTEXT INDEX store_product_title_description_ft (title, description)')
+
+
+def drop_native_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS store_product_fts')
+    elif connection.vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE store_product DROP INDEX store_product_title_description_ft')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_product_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_native_indexes, drop_native_indexes),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2 on 2026-10-17 00:16
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+
+
+def populate_effective_price(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    products = list(
+        Product.objects.annotate(best_discount=models.Max('promotions__discount')).only('id', 'unit_price'))
+    for product in products:
+        discount = min(max(Decimal(str(product.best_discount or 0)), Decimal(0)), Decimal(1))
+        product.effective_price = (product.unit_price * (1 - discount)) \
+            .quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    Product.objects.bulk_update(products, ['effective_price'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_product_native_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, max_digits=6),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_effective_price, migrations.RunPython.noop),
+    ]
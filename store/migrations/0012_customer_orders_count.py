@@ -0,0 +1,26 @@
+# Generated by Django 3.2 on 2026-10-17 00:31
+
+from django.db import migrations, models
+
+
+def populate_orders_count(apps, schema_editor):
+    Customer = apps.get_model('store', 'Customer')
+    customers = list(Customer.objects.annotate(actual_orders_count=models.Count('order')).only('id'))
+    for customer in customers:
+        customer.orders_count = customer.actual_orders_count
+    Customer.objects.bulk_update(customers, ['orders_count'], batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='orders_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_orders_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2 on 2026-10-17 00:34
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('store', '0012_customer_orders_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdminJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(max_length=255)),
+                ('params', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('selection', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('P', 'Pending'), ('R', 'Running'), ('D', 'Done'), ('F', 'Failed'), ('C', 'Cancelled')], default='P', max_length=1)),
+                ('total', models.PositiveIntegerField(blank=True, null=True)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('last_pk', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='adminjob',
+            index=models.Index(fields=['status', 'id'], name='store_admin_status_8269ea_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+# 0005 created the inverted index empty. Fill the configured backend's index from the existing
+# catalog, so search keeps finding products right after the deploy. Only id, title and
+# description are read, so this runs against later versions of the model too.
+
+def rebuild_search_index(apps, schema_editor):
+    from store.search import get_search_backend
+    get_search_backend().rebuild()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_admin_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+    ]
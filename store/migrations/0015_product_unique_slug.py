@@ -0,0 +1,35 @@
+# Generated by Django 3.2 on 2026-10-17 01:12
+
+from django.db import migrations, models
+
+
+def deduplicate_slugs(apps, schema_editor):
+    # The oldest product keeps a shared slug, the others get their id appended
+    Product = apps.get_model('store', 'Product')
+    max_length = Product._meta.get_field('slug').max_length
+    duplicates = Product.objects.values('slug').annotate(count=models.Count('id')).filter(count__gt=1) \
+        .values_list('slug', flat=True)
+    for slug in list(duplicates):
+        for product in Product.objects.filter(slug=slug).order_by('id').only('id', 'slug')[1:]:
+            suffix = f'-{product.id}'
+            candidate = slug[:max_length - len(suffix)] + suffix
+            while Product.objects.filter(slug=candidate).exists():
+                suffix += '-1'
+                candidate = slug[:max_length - len(suffix)] + suffix
+            Product.objects.filter(id=product.id).update(slug=candidate)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_fill_product_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='slug',
+            field=models.SlugField(unique=True),
+        ),
+    ]
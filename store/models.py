@@ -1,11 +1,15 @@
 from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
 from uuid import uuid4
 
 from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django_filters.filters import ModelChoiceFilter
 
 class Promotion(models.Model):
@@ -13,27 +17,135 @@ class Promotion(models.Model):
     discount = models.FloatField()
 
 
+def fields_without_counters(instance, update_fields, counters):
+    # Denormalized counters only change through relative UPDATEs (store.signals.handlers), so saving
+    # a row that was loaded earlier leaves them out instead of writing a stale value back.
+    if instance._state.adding:
+        return update_fields
+    if update_fields is None:
+        deferred = instance.get_deferred_fields()
+        update_fields = [
+            field.name for field in instance._meta.concrete_fields
+            if not field.primary_key and field.attname not in deferred
+        ]
+    return [name for name in update_fields if name not in counters]
+
+
+class CollectionManager(models.Manager):
+    def refresh_products_count(self, collection_ids=None):
+        # Recompute the denormalized products_count from one annotated query.
+        queryset = self.get_queryset()
+        if collection_ids is not None:
+            queryset = queryset.filter(id__in=collection_ids)
+        collections = list(
+            queryset.annotate(actual_products_count=models.Count('products')).only('id'))
+        for collection in collections:
+            collection.products_count = collection.actual_products_count
+        self.bulk_update(collections, ['products_count'], batch_size=500)
+        return len(collections)
+
+
 class Collection(models.Model):
+    objects = CollectionManager()
     title = models.CharField(max_length=255)
     featured_product = models.ForeignKey(
         'Product', on_delete=models.SET_NULL, null=True, related_name='+', blank=True)
+    # Kept in sync by the Product signal handlers in store.signals.handlers
+    products_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self) -> str:
         return self.title
 
+    def save(self, *args, **kwargs):
+        kwargs['update_fields'] = fields_without_counters(self, kwargs.get('update_fields'), ['products_count'])
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['title']
 
 
+def compute_effective_price(unit_price, discount):
+    # Promotion.discount is the fraction taken off the price (0.1 = 10% off).
+    if not discount:
+        return unit_price
+    discount = min(max(Decimal(str(discount)), Decimal(0)), Decimal(1))
+    return (unit_price * (1 - discount)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+class InsufficientInventory(Exception):
+    def __init__(self, product_ids):
+        super().__init__(product_ids)
+        self.product_ids = product_ids
+
+
+class ProductManager(models.Manager):
+    def reserve_inventory(self, quantities):
+        # Takes {product_id: quantity} out of stock with one conditional UPDATE. Rows are updated
+        # (and locked) in id order so concurrent checkouts can't deadlock, and only rows with
+        # inventory >= quantity match. If any product is short nothing is taken and
+        # InsufficientInventory lists the short products.
+        if not quantities:
+            return
+        product_ids = sorted(quantities)
+        in_stock = models.Q()
+        for product_id in product_ids:
+            in_stock |= models.Q(id=product_id, inventory__gte=quantities[product_id])
+        new_inventory = models.Case(
+            *[models.When(id=product_id, then=models.F('inventory') - quantities[product_id])
+              for product_id in product_ids],
+            output_field=models.IntegerField())
+        try:
+            with transaction.atomic(using=self.db):
+                updated = self.filter(in_stock).order_by('id').update(
+                    inventory=new_inventory, last_update=timezone.now())
+                if updated < len(product_ids):
+                    raise InsufficientInventory([])
+        except InsufficientInventory:
+            inventory = dict(self.filter(id__in=product_ids).values_list('id', 'inventory'))
+            raise InsufficientInventory([
+                product_id for product_id in product_ids if inventory.get(product_id, 0) < quantities[product_id]])
+
+    def refresh_effective_prices(self, product_ids=None, chunk_size=1000):
+        # Recompute effective_price (best promotion applied) in primary key chunks and
+        # return the ids whose price changed. last_update moves with the price so ETags change too.
+        queryset = self.get_queryset()
+        if product_ids is not None:
+            queryset = queryset.filter(id__in=product_ids)
+        queryset = queryset \
+            .annotate(best_discount=models.Max('promotions__discount')) \
+            .only('id', 'unit_price', 'effective_price') \
+            .order_by('id')
+        changed_ids = []
+        last_id = 0
+        while True:
+            products = list(queryset.filter(id__gt=last_id)[:chunk_size])
+            if not products:
+                return changed_ids
+            last_id = products[-1].id
+            changed = []
+            for product in products:
+                effective_price = compute_effective_price(product.unit_price, product.best_discount)
+                if effective_price != product.effective_price:
+                    product.effective_price = effective_price
+                    product.last_update = timezone.now()
+                    changed.append(product)
+            self.bulk_update(changed, ['effective_price', 'last_update'])
+            changed_ids += [product.id for product in changed]
+
+
 class Product(models.Model):
+    objects = ProductManager()
     title = models.CharField(max_length=255)
-    slug = models.SlugField()
+    # Unique, as product imports (store.importers) upsert by slug
+    slug = models.SlugField(unique=True)
     description = models.TextField(null=True, blank=True)
     unit_price = models.DecimalField(
         max_digits=6,
         decimal_places=2,
         validators=[MinValueValidator(1)])
     inventory = models.IntegerField(validators=[MinValueValidator(0)])
+    # unit_price with the best promotion applied. Kept in sync by the signal handlers in store.signals.handlers
+    effective_price = models.DecimalField(max_digits=6, decimal_places=2, db_index=True, editable=False)
     last_update = models.DateTimeField(auto_now=True)
     collection = models.ForeignKey(Collection, on_delete=models.PROTECT,related_name='products')
     promotions = models.ManyToManyField(Promotion, blank=True)
@@ -45,7 +157,22 @@ class Product(models.Model):
         ordering = ['title']
 
 
+class CustomerManager(models.Manager):
+    def refresh_orders_count(self, customer_ids=None):
+        # Recompute the denormalized orders_count from one annotated query.
+        queryset = self.get_queryset()
+        if customer_ids is not None:
+            queryset = queryset.filter(id__in=customer_ids)
+        customers = list(queryset.annotate(actual_orders_count=models.Count('order')).only('id'))
+        for customer in customers:
+            customer.orders_count = customer.actual_orders_count
+        self.bulk_update(customers, ['orders_count'], batch_size=500)
+        return len(customers)
+
+
 class Customer(models.Model):
+    objects = CustomerManager()
+
     MEMBERSHIP_BRONZE = 'B'
     MEMBERSHIP_SILVER = 'S'
     MEMBERSHIP_GOLD = 'G'
@@ -59,7 +186,8 @@ class Customer(models.Model):
     birth_date = models.DateField(null=True, blank=True)
     membership = models.CharField(
         max_length=1, choices=MEMBERSHIP_CHOICES, default=MEMBERSHIP_BRONZE)
-
+    # Orders in store_order, kept in sync by store.signals.handlers so the admin doesn't count them
+    orders_count = models.PositiveIntegerField(default=0, editable=False)
 
     # If you have custom User model in your app or if you wanna make this app generic, relate it to user like this
     user = models.OneToOneField(settings.AUTH_USER_MODEL,on_delete=models.CASCADE)
@@ -67,6 +195,10 @@ class Customer(models.Model):
     def __str__(self):
         return f'{self.user.first_name} {self.user.last_name}'
 
+    def save(self, *args, **kwargs):
+        kwargs['update_fields'] = fields_without_counters(self, kwargs.get('update_fields'), ['orders_count'])
+        super().save(*args, **kwargs)
+
     @admin.display(ordering='user__first_name')
     def first_name(self):
         return self.user.first_name
@@ -79,7 +211,51 @@ class Customer(models.Model):
         ordering = ['user__first_name', 'user__last_name']
 
 
+class PaymentStatusTransitionError(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+class OrderManager(models.Manager):
+    def change_payment_statuses(self, new_statuses, chunk_size=1000):
+        # Applies {order_id: payment_status} all or nothing. The orders are locked and checked
+        # against Order.PAYMENT_STATUS_TRANSITIONS, then updated with one UPDATE per target status
+        # (per chunk of ids). Returns the applied (order_id, old, new) changes, or raises
+        # PaymentStatusTransitionError listing every order that can't change.
+        order_ids = sorted(new_statuses)
+        changes = []
+        errors = {}
+        with transaction.atomic(using=self.db):
+            current = {}
+            for start in range(0, len(order_ids), chunk_size):
+                current.update(self.select_for_update()
+                               .filter(id__in=order_ids[start:start + chunk_size])
+                               .order_by('id')
+                               .values_list('id', 'payment_status'))
+            for order_id in order_ids:
+                old, new = current.get(order_id), new_statuses[order_id]
+                if old is None:
+                    errors[order_id] = 'No order with the given ID exists'
+                elif old != new and new not in self.model.PAYMENT_STATUS_TRANSITIONS[old]:
+                    errors[order_id] = f'Payment status cannot change from {old} to {new}'
+                elif old != new:
+                    changes.append((order_id, old, new))
+            if errors:
+                raise PaymentStatusTransitionError(errors)
+
+            ids_by_status = {}
+            for order_id, old, new in changes:
+                ids_by_status.setdefault(new, []).append(order_id)
+            for status, ids in ids_by_status.items():
+                for start in range(0, len(ids), chunk_size):
+                    self.filter(id__in=ids[start:start + chunk_size]).update(payment_status=status)
+        return changes
+
+
 class Order(models.Model):
+    objects = OrderManager()
+
     PAYMENT_STATUS_PENDING = 'P'
     PAYMENT_STATUS_COMPLETE = 'C'
     PAYMENT_STATUS_FAILED = 'F'
@@ -88,8 +264,15 @@ class Order(models.Model):
         (PAYMENT_STATUS_COMPLETE, 'Complete'),
         (PAYMENT_STATUS_FAILED, 'Failed')
     ]
-
-    placed_at = models.DateTimeField(auto_now_add=True)
+    # Payment status changes allowed by the bulk payment status endpoint
+    PAYMENT_STATUS_TRANSITIONS = {
+        PAYMENT_STATUS_PENDING: {PAYMENT_STATUS_COMPLETE, PAYMENT_STATUS_FAILED},
+        PAYMENT_STATUS_FAILED: {PAYMENT_STATUS_PENDING, PAYMENT_STATUS_COMPLETE},
+        PAYMENT_STATUS_COMPLETE: set(),
+    }
+
+    # Indexed for the archival sweep (store.archive) and placed_at ordering
+    placed_at = models.DateTimeField(auto_now_add=True, db_index=True)
     payment_status = models.CharField(
         max_length=1, choices=PAYMENT_STATUS_CHOICES, default=PAYMENT_STATUS_PENDING)
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT)
@@ -107,6 +290,50 @@ class OrderItem(models.Model):
     unit_price = models.DecimalField(max_digits=6, decimal_places=2)
 
 
+# Orders moved out of store_order/store_orderitem by store.archive, keeping their ids.
+# The reverse accessor matches Order's, so OrderSerializer renders archived orders unchanged.
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    placed_at = models.DateTimeField(db_index=True)
+    payment_status = models.CharField(max_length=1, choices=Order.PAYMENT_STATUS_CHOICES)
+    customer = models.ForeignKey(Customer, on_delete=models.PROTECT, related_name='+')
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='orderitem_set')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='+')
+    quantity = models.PositiveSmallIntegerField()
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2)
+
+
+# Daily sales per product and per collection, split by the orders' current payment status.
+# Maintained by store.rollups from the order signals; `manage.py backfill_sales_rollups` rebuilds them.
+class ProductSalesRollup(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    payment_status = models.CharField(max_length=1, choices=Order.PAYMENT_STATUS_CHOICES)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [['date', 'product', 'payment_status']]
+
+
+class CollectionSalesRollup(models.Model):
+    date = models.DateField()
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='+')
+    payment_status = models.CharField(max_length=1, choices=Order.PAYMENT_STATUS_CHOICES)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [['date', 'collection', 'payment_status']]
+
+
 class Address(models.Model):
     street = models.CharField(max_length=255)
     city = models.CharField(max_length=255)
@@ -114,12 +341,81 @@ class Address(models.Model):
         Customer, on_delete=models.CASCADE)
 
 
+def cart_line_total(prefix=''):
+    # quantity * effective_price of a cart item, computed by the database. Checkout charges
+    # effective_price too, so the cart total is what the order will cost.
+    return models.ExpressionWrapper(
+        models.F(prefix + 'quantity') * models.F(prefix + 'product__effective_price'),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2))
+
+
+class CartManager(models.Manager):
+    def with_totals(self):
+        return self.get_queryset().annotate(
+            items_count=models.Count('items'),
+            total_quantity=Coalesce(models.Sum('items__quantity'), models.Value(0), output_field=models.IntegerField()),
+            total_price=models.Sum(cart_line_total('items__')))
+
+
 class Cart(models.Model):
+    objects = CartManager()
     id = models.UUIDField(primary_key=True, default= uuid4)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Indexed for the abandoned cart sweep (manage.py sweep_carts)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class CartItemManager(models.Manager):
+    def with_total_price(self):
+        return self.get_queryset().annotate(total_price=cart_line_total())
+
+    def add_items(self, cart_id, items):
+        # Adds (product_id, quantity) pairs to a cart with a single INSERT ... ON CONFLICT
+        # (ON DUPLICATE KEY on MySQL) that increments the quantity of items already in the cart,
+        # so concurrent adds never race into the unique (cart, product) constraint.
+        # Returns a CartItem per product carrying its id and new quantity.
+        quantities = {}
+        for product_id, quantity in items:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        if not quantities:
+            return []
+
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        id_column, cart_column, product_column, quantity_column = [
+            qn(self.model._meta.get_field(name).column) for name in ('id', 'cart', 'product', 'quantity')]
+        cart_value = self.model._meta.get_field('cart').get_db_prep_value(cart_id, connection)
+        # Sorted so concurrent batches lock rows in the same order
+        product_ids = sorted(quantities)
+        params = [value for product_id in product_ids for value in (cart_value, product_id, quantities[product_id])]
+        sql = (f'INSERT INTO {table} ({cart_column}, {product_column}, {quantity_column}) '
+               f'VALUES {", ".join(["(%s, %s, %s)"] * len(product_ids))} ')
+        if connection.vendor == 'mysql':
+            sql += f'ON DUPLICATE KEY UPDATE {quantity_column} = {quantity_column} + VALUES({quantity_column})'
+        else:
+            sql += (f'ON CONFLICT ({cart_column}, {product_column}) '
+                    f'DO UPDATE SET {quantity_column} = {table}.{quantity_column} + excluded.{quantity_column}')
+        returning = connection.vendor == 'postgresql' or (
+            connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35))
+        if returning:
+            sql += f' RETURNING {id_column}, {product_column}, {quantity_column}'
+
+        with transaction.atomic(using=self.db):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall() if returning else None
+            if rows is None:
+                rows = self.filter(cart_id=cart_id, product_id__in=product_ids) \
+                    .values_list('id', 'product_id', 'quantity')
+        saved = {product_id: (id, quantity) for id, product_id, quantity in rows}
+        return [
+            self.model(id=saved[product_id][0], cart_id=cart_id, product_id=product_id, quantity=saved[product_id][1])
+            for product_id in quantities
+        ]
 
 
 class CartItem(models.Model):
+    objects = CartItemManager()
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveSmallIntegerField(validators=[MinValueValidator(1)])
@@ -127,8 +423,74 @@ class CartItem(models.Model):
     class Meta:
         unique_together = [['cart','product']]
 
+
+class ProductSearchDocument(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    length = models.PositiveIntegerField()
+
+
+class ProductSearchTerm(models.Model):
+    # Posting list of the built-in inverted index (see store.search)
+    term = models.CharField(max_length=64)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    frequency = models.PositiveIntegerField()
+    # Copied from ProductSearchDocument so ranking only reads the postings
+    document_length = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = [['term', 'product']]
+
+
 class Review(models.Model):
     product = models.ForeignKey(Product,on_delete=models.CASCADE,related_name='reviews')
     name = models.CharField(max_length=255)
     description = models.TextField()
-    date = models.DateField(auto_now_add=True)
\ No newline at end of file
+    date = models.DateField(auto_now_add=True)
+
+class OutboxMessage(models.Model):
+    # Signal to be sent by the outbox worker (see store.outbox), written in the same
+    # transaction as the change it announces.
+    event = models.CharField(max_length=255)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['processed_at', 'available_at'])]
+
+
+class AdminJob(models.Model):
+    # Bulk admin action run in primary key chunks by `manage.py run_admin_jobs` (see store.admin_jobs).
+    STATUS_PENDING = 'P'
+    STATUS_RUNNING = 'R'
+    STATUS_DONE = 'D'
+    STATUS_FAILED = 'F'
+    STATUS_CANCELLED = 'C'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_CANCELLED, 'Cancelled'),
+    ]
+    action = models.CharField(max_length=255)
+    params = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    # {'pks': [...]} for rows picked in the changelist, or {'filters': {...}} with the changelist's
+    # query parameters for "select all", rebuilt into a queryset by store.admin_jobs.get_queryset
+    selection = models.JSONField(default=dict)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    processed = models.PositiveIntegerField(default=0)
+    last_pk = models.BigIntegerField(null=True, blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'])]
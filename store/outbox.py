@@ -0,0 +1,101 @@
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from store.models import OutboxMessage
+from store.signals import order_created, order_payment_status_changed
+
+# Transactional outbox. publish() stores a signal as an OutboxMessage in the caller's transaction,
+# so it only exists if that transaction commits, and `manage.py process_outbox` sends it later,
+# outside the request. Delivery is at least once: a message whose receivers fail is retried
+# with backoff, and its receivers may run again.
+#
+# Model instances passed as signal arguments are stored by primary key and loaded again
+# before the signal is sent.
+
+EVENTS = {
+    'order_created': order_created,
+    'order_payment_status_changed': order_payment_status_changed,
+}
+
+MAX_ATTEMPTS = getattr(settings, 'STORE_OUTBOX_MAX_ATTEMPTS', 10)
+CLAIM_TIMEOUT = getattr(settings, 'STORE_OUTBOX_CLAIM_TIMEOUT', timedelta(minutes=5))
+MODEL_KEY = '__model__'
+
+
+def encode(value):
+    if isinstance(value, models.Model):
+        return {MODEL_KEY: value._meta.label_lower, 'pk': value.pk}
+    return value
+
+
+def decode(value):
+    if isinstance(value, dict) and MODEL_KEY in value:
+        return apps.get_model(value[MODEL_KEY])._default_manager.get(pk=value['pk'])
+    return value
+
+
+def publish(event, **kwargs):
+    if event not in EVENTS:
+        raise ValueError(f'Unknown outbox event: {event}')
+    return OutboxMessage.objects.create(
+        event=event, payload={name: encode(value) for name, value in kwargs.items()})
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(2 ** attempts, 3600))
+
+
+def deliver(message):
+    signal = EVENTS[message.event]
+    kwargs = {name: decode(value) for name, value in message.payload.items()}
+    signal.send(sender=OutboxMessage, **kwargs)
+
+
+def claim_batch(batch_size=100):
+    # Claims up to batch_size due messages in a short transaction: each one is leased for
+    # CLAIM_TIMEOUT (available_at moves past it), so other workers leave it alone, and a message
+    # whose worker dies is picked up again once the lease runs out. Workers running side by side
+    # skip the rows another worker is claiming where the database supports SKIP LOCKED.
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = OutboxMessage.objects \
+            .filter(processed_at__isnull=True, available_at__lte=now, attempts__lt=MAX_ATTEMPTS) \
+            .order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        messages = list(queryset[:batch_size])
+        for message in messages:
+            message.attempts += 1
+            message.available_at = now + CLAIM_TIMEOUT
+        OutboxMessage.objects.bulk_update(messages, ['attempts', 'available_at'])
+    return messages
+
+
+def process_batch(batch_size=100):
+    # Sends a claimed batch, each message in its own transaction with its receivers' writes,
+    # so a slow or failing receiver holds no locks on the rest of the batch.
+    messages = claim_batch(batch_size)
+    for message in messages:
+        try:
+            with transaction.atomic():
+                deliver(message)
+                message.processed_at = timezone.now()
+                message.last_error = ''
+                message.save(update_fields=['processed_at', 'last_error'])
+        except Exception:
+            message.processed_at = None
+            message.last_error = traceback.format_exc()
+            message.available_at = timezone.now() + retry_delay(message.attempts)
+            message.save(update_fields=['last_error', 'available_at'])
+    return messages
+
+
+def purge_processed(older_than):
+    return OutboxMessage.objects \
+        .filter(processed_at__lt=timezone.now() - older_than) \
+        .delete()[0]
@@ -1,4 +1,200 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from collections import OrderedDict
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, Cursor, CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+from store.dbstats import approximate_count
+
+
+class EstimatedCountPaginator(Paginator):
+    # Admin changelist paginator that never runs an exact COUNT(*): unfiltered lists are counted
+    # from table statistics and filtered ones up to `count_cap` rows, so only the first
+    # count_cap / list_per_page pages of a large filtered result can be reached.
+    # Use with show_full_result_count = False, or the changelist counts the whole table anyway.
+    count_cap = 10000
+
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list, self.count_cap)
+
 
 class DefaultPagination(PageNumberPagination):
-    page_size = 10
\ No newline at end of file
+    page_size = 10
+
+
+class KeysetPagination(CursorPagination):
+    # Seeks to the page with a WHERE on the ordering columns instead of COUNT(*) + OFFSET,
+    # so every page costs the same no matter how deep it is.
+    # The ordering comes from ?ordering= (OrderingFilter), an order_by() applied by an earlier
+    # filter backend (e.g. search ranking), the view's `ordering` attribute, or `ordering` below.
+    # `tiebreaker` is always appended so the position is unique.
+    page_size = 10
+    ordering = 'id'
+    tiebreaker = 'id'
+    # ?count=1 adds an approximate total to the response.
+    count_query_param = 'count'
+    count_cap = 10000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = approximate_count(queryset, self.count_cap)
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.decode_position(self.cursor)
+
+        # Rows from values() querysets must carry the ordering columns to build the next cursor.
+        fields = getattr(queryset, '_fields', None)
+        if fields:
+            missing = [order.lstrip('-') for order in self.ordering if order.lstrip('-') not in fields]
+            if missing:
+                queryset = queryset.values(*fields, *missing)
+
+        if reverse:
+            queryset = queryset.order_by(*reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position, reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > len(self.page)
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        if self.page:
+            self.next_position = self._get_position_from_instance(self.page[-1], self.ordering)
+            self.previous_position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            self.has_next = self.has_previous = False
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            ordering_param = getattr(backend, 'ordering_param', None)
+            if ordering_param and request.query_params.get(ordering_param):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        if not ordering and queryset.query.order_by:
+            ordering = [order for order in queryset.query.order_by if isinstance(order, str)]
+        if not ordering:
+            ordering = getattr(view, 'ordering', None) or self.ordering
+
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        ordering = tuple(ordering)
+        if self.tiebreaker not in [order.lstrip('-') for order in ordering]:
+            ordering += (self.tiebreaker,)
+        return ordering
+
+    def get_keyset_filter(self, position, reverse):
+        # (a, b) > (x, y)  ==>  a > x OR (a = x AND b > y), honouring each column's direction.
+        keyset_filter = Q()
+        for index, order in enumerate(self.ordering):
+            descending = order.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            clause = Q(**{f'{order.lstrip("-")}__{lookup}': position[index]})
+            for previous_order, previous_value in zip(self.ordering[:index], position[:index]):
+                clause &= Q(**{previous_order.lstrip('-'): previous_value})
+            keyset_filter |= clause
+        return keyset_filter
+
+    def decode_position(self, cursor):
+        if cursor is None or cursor.position is None:
+            return None
+        try:
+            position = json.loads(cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        # The cursor belongs to a different ordering.
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            field_name = order.lstrip('-')
+            if isinstance(instance, dict):
+                attr = instance[field_name]
+            else:
+                attr = getattr(instance, field_name)
+            values.append(str(attr))
+        return json.dumps(values)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count is not None:
+            response['count'] = self.count
+        response['results'] = data
+        return Response(response)
+
+
+class CursorOptInPagination(BasePagination):
+    # Keyset pagination for clients that ask for it with ?cursor= (empty for the first page).
+    # Other requests are paginated by `default_class`, or not at all when it's None.
+    keyset_class = KeysetPagination
+    default_class = None
+
+    def __init__(self):
+        self.paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.paginator = self.keyset_class()
+        elif self.default_class is not None:
+            self.paginator = self.default_class()
+        else:
+            return None
+        page = self.paginator.paginate_queryset(queryset, request, view)
+        self.display_page_controls = getattr(self.paginator, 'display_page_controls', False)
+        return page
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+
+class ProductPagination(CursorOptInPagination):
+    default_class = DefaultPagination
+
+
+def reverse_ordering(ordering):
+    return tuple(order[1:] if order.startswith('-') else '-' + order for order in ordering)
@@ -0,0 +1,129 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from store.models import (
+    ArchivedOrderItem, CollectionSalesRollup, OrderItem, ProductSalesRollup)
+
+# Incremental maintenance of the sales rollup tables. Changes are collected as deltas per
+# (date, product or collection, payment_status) and added to the stored rows with one upsert
+# per table. The receivers in store.signals.handlers run in the outbox worker, in the same
+# transaction that marks the message processed, so each order is counted once.
+
+ITEM_FIELDS = [
+    'order_id', 'order__placed_at', 'order__payment_status',
+    'product_id', 'product__collection_id', 'quantity', 'unit_price',
+]
+
+
+class RollupDeltas:
+    def __init__(self):
+        self.products = defaultdict(lambda: [0, Decimal(0), 0])
+        self.collections = defaultdict(lambda: [0, Decimal(0), 0])
+
+    def add(self, item_rows, sign=1, payment_status=None):
+        # item_rows are ITEM_FIELDS tuples. payment_status overrides the orders' current status,
+        # e.g. to take an order out of the bucket it was counted in before a status change.
+        product_orders = defaultdict(set)
+        collection_orders = defaultdict(set)
+        for order_id, placed_at, status, product_id, collection_id, quantity, unit_price in item_rows:
+            date = timezone.localdate(placed_at)
+            status = payment_status or status
+            for totals, orders, key in ((self.products, product_orders, (date, product_id, status)),
+                                        (self.collections, collection_orders, (date, collection_id, status))):
+                totals[key][0] += sign * quantity
+                totals[key][1] += sign * quantity * unit_price
+                orders[key].add(order_id)
+        for totals, orders in ((self.products, product_orders), (self.collections, collection_orders)):
+            for key, order_ids in orders.items():
+                totals[key][2] += sign * len(order_ids)
+
+    def save(self):
+        with transaction.atomic():
+            add_to_rollup(ProductSalesRollup, 'product', self.products)
+            add_to_rollup(CollectionSalesRollup, 'collection', self.collections)
+
+
+def add_to_rollup(model, target, deltas):
+    # INSERT ... ON CONFLICT (ON DUPLICATE KEY on MySQL) adding units, revenue and orders_count
+    # to the existing rows.
+    deltas = {key: values for key, values in deltas.items() if any(values)}
+    if not deltas:
+        return
+    connection = connections[model.objects.db]
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    names = ['date', target, 'payment_status', 'units', 'revenue', 'orders_count']
+    fields = [model._meta.get_field(name) for name in names]
+    columns = [qn(field.column) for field in fields]
+    key_columns, value_columns = columns[:3], columns[3:]
+
+    params = []
+    # Sorted so concurrent workers lock rows in the same order
+    for key in sorted(deltas):
+        for field, value in zip(fields, (*key, *deltas[key])):
+            params.append(field.get_db_prep_save(value, connection))
+    row = f'({", ".join(["%s"] * len(columns))})'
+    sql = f'INSERT INTO {table} ({", ".join(columns)}) VALUES {", ".join([row] * len(deltas))} '
+    if connection.vendor == 'mysql':
+        sql += 'ON DUPLICATE KEY UPDATE ' + ', '.join(
+            f'{column} = {column} + VALUES({column})' for column in value_columns)
+    else:
+        sql += f'ON CONFLICT ({", ".join(key_columns)}) DO UPDATE SET ' + ', '.join(
+            f'{column} = {table}.{column} + excluded.{column}' for column in value_columns)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def item_rows(order_ids, archived=False):
+    model = ArchivedOrderItem if archived else OrderItem
+    return model.objects.filter(order_id__in=order_ids).values_list(*ITEM_FIELDS).iterator()
+
+
+def record_orders(order_ids, payment_status=None):
+    # payment_status is the status the orders were placed with. Later changes arrive as
+    # order_payment_status_changed and are applied on top of it.
+    deltas = RollupDeltas()
+    deltas.add(item_rows(order_ids), payment_status=payment_status)
+    deltas.save()
+
+
+def record_payment_status_changes(changes):
+    # changes: (order_id, old_status, new_status). The orders are read once and moved from
+    # the old status bucket to the new one.
+    changes = [(order_id, old, new) for order_id, old, new in changes if old != new]
+    if not changes:
+        return
+    rows_by_order = defaultdict(list)
+    for row in item_rows([order_id for order_id, old, new in changes]):
+        rows_by_order[row[0]].append(row)
+    deltas = RollupDeltas()
+    for order_id, old, new in changes:
+        deltas.add(rows_by_order[order_id], -1, old)
+        deltas.add(rows_by_order[order_id], 1, new)
+    deltas.save()
+
+
+def rebuild(chunk_size=1000):
+    # Recomputes both tables from the live and archived orders, chunk by chunk in order id order.
+    # Orders whose messages are still queued in the outbox would be counted twice, so the outbox
+    # worker must be drained and stopped while this runs.
+    ProductSalesRollup.objects.all().delete()
+    CollectionSalesRollup.objects.all().delete()
+    orders = 0
+    for archived in (True, False):
+        model = ArchivedOrderItem if archived else OrderItem
+        order_ids = model.objects.values_list('order_id', flat=True).distinct().order_by('order_id')
+        last_id = 0
+        while True:
+            chunk = list(order_ids.filter(order_id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1]
+            deltas = RollupDeltas()
+            deltas.add(item_rows(chunk, archived))
+            deltas.save()
+            orders += len(chunk)
+    return orders
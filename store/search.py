@@ -0,0 +1,222 @@
+import hashlib
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Avg, Case, Count, ExpressionWrapper, F, FloatField, IntegerField, Sum, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from store.models import Product, ProductSearchDocument, ProductSearchTerm
+
+TOKEN_PATTERN = re.compile(r'\w+')
+MAX_TERM_LENGTH = ProductSearchTerm._meta.get_field('term').max_length
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_PATTERN.findall(text.lower())]
+
+
+def rank_by_ids(queryset, ranked_ids):
+    # Restrict the queryset to ranked_ids and order it by their position (search_rank 0 is the best match).
+    if not ranked_ids:
+        return queryset.none()
+    return queryset \
+        .filter(id__in=ranked_ids) \
+        .annotate(search_rank=Case(
+            *[When(id=product_id, then=Value(rank)) for rank, product_id in enumerate(ranked_ids)],
+            output_field=IntegerField())) \
+        .order_by('search_rank')
+
+
+class SearchBackend:
+    # Number of best matches a search can return
+    max_results = 1000
+
+    def search(self, queryset, query):
+        # Returns the queryset filtered to the matches, annotated with `search_rank` and ordered by relevance.
+        raise NotImplementedError
+
+    def index(self, products):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def rebuild(self, chunk_size=1000):
+        self.clear()
+        last_id = 0
+        while True:
+            products = list(Product.objects.filter(id__gt=last_id).order_by('id')
+                            .only('id', 'title', 'description')[:chunk_size])
+            if not products:
+                break
+            self.index(products)
+            last_id = products[-1].id
+
+    def clear(self):
+        pass
+
+
+class InvertedIndexBackend(SearchBackend):
+    # Built-in inverted index (ProductSearchTerm postings) ranked with BM25. Scores are summed
+    # in the database and only the best max_results product ids come back. Terms found in more
+    # than max_term_documents products (stopwords, in effect) are left out unless every term is.
+    k1 = 1.2
+    b = 0.75
+    max_term_documents = 50000
+    stats_cache_key = 'store:search:stats'
+    df_cache_key_prefix = 'store:search:df:'
+    stats_timeout = 300
+
+    def search(self, queryset, query):
+        terms = set(tokenize(query))
+        if not terms:
+            return queryset.none()
+
+        # idf always comes from the whole index, whatever the queryset is filtered on
+        documents_count, average_length = self.get_stats()
+        document_frequency = {term: df for term, df in self.get_document_frequencies(terms).items() if df}
+        if not document_frequency:
+            return queryset.none()
+        terms = [term for term, df in document_frequency.items() if df <= self.max_term_documents] \
+            or [min(document_frequency, key=document_frequency.get)]
+        idf = Case(*[
+            When(term=term, then=Value(math.log(
+                (documents_count - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5) + 1)))
+            for term in terms
+        ], output_field=FloatField())
+        norm = Value(self.k1 * (1 - self.b)) + Value(self.k1 * self.b / average_length) * F('document_length')
+        score = ExpressionWrapper(
+            idf * F('frequency') * Value(self.k1 + 1) / (F('frequency') + norm), output_field=FloatField())
+
+        postings = ProductSearchTerm.objects.filter(term__in=terms)
+        if queryset.query.where:
+            postings = postings.filter(product_id__in=queryset.values('id'))
+        ranked_ids = list(postings
+                          .values('product_id')
+                          .annotate(score=Sum(score))
+                          .order_by('-score', 'product_id')
+                          .values_list('product_id', flat=True)[:self.max_results])
+        return rank_by_ids(queryset, ranked_ids)
+
+    def get_document_frequencies(self, terms):
+        keys = {self.df_cache_key_prefix + hashlib.md5(term.encode()).hexdigest(): term for term in terms}
+        cached = cache.get_many(keys)
+        frequencies = {keys[key]: df for key, df in cached.items()}
+        missing = [term for term in terms if term not in frequencies]
+        if missing:
+            counted = dict(ProductSearchTerm.objects
+                           .filter(term__in=missing)
+                           .values('term')
+                           .annotate(df=Count('id'))
+                           .values_list('term', 'df'))
+            # Terms not in the index yet aren't cached, so new products are found right away
+            cache.set_many({key: counted[term] for key, term in keys.items() if term in counted}, self.stats_timeout)
+            frequencies.update(counted)
+        return frequencies
+
+    def get_stats(self):
+        stats = cache.get(self.stats_cache_key)
+        if stats is None:
+            aggregate = ProductSearchDocument.objects.aggregate(count=Count('pk'), average_length=Avg('length'))
+            stats = (max(aggregate['count'], 1), aggregate['average_length'] or 1)
+            cache.set(self.stats_cache_key, stats, self.stats_timeout)
+        return stats
+
+    def index(self, products):
+        documents = []
+        postings = []
+        for product in products:
+            tokens = tokenize(product.title) + tokenize(product.description)
+            documents.append(ProductSearchDocument(product_id=product.id, length=len(tokens)))
+            postings += [
+                ProductSearchTerm(term=term, product_id=product.id, frequency=frequency, document_length=len(tokens))
+                for term, frequency in Counter(tokens).items()
+            ]
+        product_ids = [document.product_id for document in documents]
+        with transaction.atomic():
+            self.remove(product_ids)
+            ProductSearchDocument.objects.bulk_create(documents, batch_size=500)
+            ProductSearchTerm.objects.bulk_create(postings, batch_size=1000)
+
+    def remove(self, product_ids):
+        ProductSearchTerm.objects.filter(product_id__in=product_ids).delete()
+        ProductSearchDocument.objects.filter(product_id__in=product_ids).delete()
+
+    def clear(self):
+        ProductSearchTerm.objects.all().delete()
+        ProductSearchDocument.objects.all().delete()
+        cache.delete(self.stats_cache_key)
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    # Uses the store_product_fts table created by migration 0006 (SQLite only).
+    table = 'store_product_fts'
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        match = ' OR '.join('"%s"' % term for term in terms)
+        sql = f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s'
+        params = [match]
+        # The queryset's filters go into the match, so the LIMIT only counts products it can return
+        if queryset.query.where:
+            ids_sql, ids_params = queryset.order_by().values('id').query.sql_with_params()
+            sql += f' AND rowid IN ({ids_sql})'
+            params += list(ids_params)
+        with connection.cursor() as cursor:
+            cursor.execute(f'{sql} ORDER BY rank LIMIT %s', params + [self.max_results])
+            ranked_ids = [row[0] for row in cursor.fetchall()]
+        return rank_by_ids(queryset, ranked_ids)
+
+    def index(self, products):
+        products = list(products)
+        with transaction.atomic(), connection.cursor() as cursor:
+            self.remove([product.id for product in products])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, title, description) VALUES (%s, %s, %s)',
+                [(product.id, product.title, product.description) for product in products])
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid IN ({", ".join(["%s"] * len(product_ids))})',
+                product_ids)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+
+class MySQLFulltextBackend(SearchBackend):
+    # Uses the FULLTEXT index created by migration 0006 (MySQL only). MySQL maintains the index itself.
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        relevance = RawSQL(
+            'MATCH (store_product.title, store_product.description) AGAINST (%s IN NATURAL LANGUAGE MODE)',
+            [' '.join(terms)], output_field=FloatField())
+        return queryset \
+            .annotate(search_rank=relevance) \
+            .filter(search_rank__gt=0) \
+            .order_by('-search_rank')
+
+    def rebuild(self, chunk_size=1000):
+        pass
+
+
+def get_search_backend():
+    backend = getattr(settings, 'STORE_SEARCH_BACKEND', 'store.search.InvertedIndexBackend')
+    return import_string(backend)()
@@ -1,13 +1,18 @@
 from django.db.models import fields
-from django.db import transaction
+from django.db import IntegrityError, connection, transaction
 from decimal import Decimal
 
 from rest_framework import serializers
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.fields import SerializerMethodField
 
-from store.models import Cart, CartItem, Customer, Order, OrderItem, Product, Collection, Review
-from store.signals import order_created
+from store import caching, outbox
+from store.carts import get_cart_store
+from store.customers import get_request_customer_id
+from store.models import Cart, CartItem, Customer, InsufficientInventory, Order, OrderItem, Product, Collection, Review
+
+# Built once instead of per row. Decimal(1.1) is the binary float value, which the API has always returned.
+TAX_RATE = Decimal(1.1)
 
 # NORMAL SERIALIZERS
 
@@ -56,22 +61,35 @@ class CollectionSerializer(serializers.ModelSerializer):
         model = Collection
         fields = ['id','title','products_count']
 
-    products_count = serializers.SerializerMethodField()
-    def get_products_count(self,collection: Collection):
-        return collection.products.count()
+    # Denormalized column maintained by the Product signal handlers, so listing collections doesn't need a COUNT per row.
+    products_count = serializers.IntegerField(read_only=True)
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         # If field is present in Model, then it takes it from there. Else, it takes the field from this class's fields (written below).
-        fields=['id','title','slug','description','unit_price','price_with_tax','collection','inventory']
+        fields=['id','title','slug','description','unit_price','price_with_tax','effective_price','collection','inventory']
     
     # price = serializers.DecimalField(max_digits=6,decimal_places=2,source='unit_price')
     slug = serializers.SlugField(read_only=True)
 
     price_with_tax = serializers.SerializerMethodField()
+    # Model fields each SerializerMethodField reads (used by store.fieldsets to prune columns)
+    field_dependencies = {'price_with_tax': ['unit_price']}
+    # values() lookups and row function replacing each SerializerMethodField in store.compiled_serializers
+    compiled_methods = {'price_with_tax': (['unit_price'], lambda unit_price: unit_price * TAX_RATE)}
+
     def get_price_with_tax(self,product:Product):
-        return product.unit_price * Decimal(1.1)
+        return product.unit_price * TAX_RATE
+
+    # The slug is derived from the title and is unique
+    def validate_title(self, value):
+        products = Product.objects.filter(slug=value.replace(" ","-"))
+        if self.instance is not None:
+            products = products.exclude(pk=self.instance.pk)
+        if products.exists():
+            raise serializers.ValidationError('A product with this title already exists')
+        return value
 
     # collection = serializers.HyperlinkedRelatedField(queryset=Collection.objects.all(),view_name='collection-detail')
 
@@ -112,31 +130,53 @@ class SimpleProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = ['id','title','unit_price']
 
+class CartProductSerializer(SimpleProductSerializer):
+    # Cart totals are priced at effective_price, as checkout charges it
+    class Meta(SimpleProductSerializer.Meta):
+        fields = SimpleProductSerializer.Meta.fields + ['effective_price']
+
+class AddCartItemListSerializer(serializers.ListSerializer):
+    # Batch form: POSTing a list adds every item with one upsert statement
+    def save(self, **kwargs):
+        items = [(item['product_id'], item['quantity']) for item in self.validated_data]
+        self.instance = AddCartItemSerializer.add_items(self.context['cart_id'], items)
+        return self.instance
+
 class AddCartItemSerializer(serializers.ModelSerializer):
     product_id = serializers.IntegerField()
 
-    def validate_product_id(self, value):
-        if not Product.objects.filter(id = value).exists():
-            raise serializers.ValidationError('No product with the given product ID exists')
-        return value
-
     class Meta:
         model = CartItem
         fields = ['id','product_id','quantity']
+        list_serializer_class = AddCartItemListSerializer
+
+    @staticmethod
+    def add_items(cart_id, items):
+        # Where foreign keys are checked at once (MySQL), cart and product are only looked up when
+        # the upsert violates one. Deferred checks (PostgreSQL, SQLite) only fail at commit,
+        # too late to report, so there they are looked up first.
+        if connection.features.can_defer_constraint_checks:
+            AddCartItemSerializer.check_references(cart_id, items)
+        try:
+            # In a savepoint of its own, so the failed statement leaves an outer transaction usable
+            with transaction.atomic():
+                return CartItem.objects.add_items(cart_id, items)
+        except IntegrityError:
+            AddCartItemSerializer.check_references(cart_id, items)
+            raise
+
+    @staticmethod
+    def check_references(cart_id, items):
+        if not Cart.objects.filter(id=cart_id).exists():
+            raise NotFound('No cart with the given ID exists')
+        product_ids = {product_id for product_id, quantity in items}
+        if Product.objects.filter(id__in=product_ids).count() < len(product_ids):
+            raise ValidationError({'product_id': ['No product with the given product ID exists']})
 
     def save(self, **kwargs):
         cart_id = self.context['cart_id']
-        product_id = self.validated_data['product_id']
-        quantity = self.validated_data['quantity']
-
-        try:
-            cart_item = CartItem.objects.get(cart_id=cart_id,product_id=product_id)
-            cart_item.quantity += quantity
-            cart_item.save()
-            self.instance = cart_item
-        except CartItem.DoesNotExist:
-            self.instance = CartItem.objects.create(cart_id = cart_id, **self.validated_data)
-        
+        items = [(self.validated_data['product_id'], self.validated_data['quantity'])]
+        self.instance = self.add_items(cart_id, items)[0]
         return self.instance
 
 class UpdateCartItemSerializer(serializers.ModelSerializer):
@@ -145,26 +185,46 @@ class UpdateCartItemSerializer(serializers.ModelSerializer):
         fields = ['quantity']
 
 class CartItemSerializer(serializers.ModelSerializer):
-    product = SimpleProductSerializer()
+    product = CartProductSerializer()
     total_price = SerializerMethodField()
+    field_dependencies = {'total_price': []}
+    compiled_methods = {'total_price': (['total_price'], lambda total_price: total_price)}
     class Meta:
         model = CartItem
         fields = ['id','product','quantity','total_price']
 
     def get_total_price(self,cart_item:CartItem):
-        return cart_item.product.unit_price * cart_item.quantity
+        # Annotated by CartItem.objects.with_total_price(); computed here for items loaded without it
+        if hasattr(cart_item,'total_price'):
+            return cart_item.total_price
+        return cart_item.product.effective_price * cart_item.quantity
         
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True,read_only=True)
     total_price = SerializerMethodField()
+    field_dependencies = {'total_price': []}
     class Meta:
         model = Cart
         fields = ['id', 'created_at','items','total_price']
         read_only_fields = ('id', 'created_at', 'items','total_price')
     
     def get_total_price(self,cart:Cart):
+        # Annotated by Cart.objects.with_totals() (None for an empty cart)
+        if hasattr(cart,'total_price'):
+            return cart.total_price or 0
         cart_items = cart.items.all()
-        return sum([item.quantity * item.product.unit_price for item in cart_items])
+        return sum([item.quantity * item.product.effective_price for item in cart_items])
+
+class CartSummarySerializer(serializers.ModelSerializer):
+    items_count = serializers.IntegerField(read_only=True)
+    total_quantity = serializers.IntegerField(read_only=True)
+    total_price = SerializerMethodField()
+    class Meta:
+        model = Cart
+        fields = ['id','items_count','total_quantity','total_price']
+
+    def get_total_price(self,cart:Cart):
+        return cart.total_price or 0
 
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -193,11 +253,37 @@ class UpdateOrderSerializer(serializers.ModelSerializer):
         model = Order
         fields=['id','payment_status']
 
+    def validate_payment_status(self, payment_status):
+        # Same rules as the bulk payment status endpoint (OrderManager.change_payment_statuses)
+        old = self.instance.payment_status if self.instance is not None else None
+        if old is not None and old != payment_status \
+                and payment_status not in Order.PAYMENT_STATUS_TRANSITIONS[old]:
+            raise ValidationError(f'Payment status cannot change from {old} to {payment_status}')
+        return payment_status
+
+
+class PaymentStatusChangeListSerializer(serializers.ListSerializer):
+    def validate(self, attrs):
+        new_statuses = {}
+        for change in attrs:
+            if new_statuses.setdefault(change['id'], change['payment_status']) != change['payment_status']:
+                raise ValidationError(f"Order {change['id']} is given more than one payment status")
+        return attrs
+
+class PaymentStatusChangeSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    payment_status = serializers.ChoiceField(choices=Order.PAYMENT_STATUS_CHOICES)
+
+    class Meta:
+        list_serializer_class = PaymentStatusChangeListSerializer
+
 
 class CreateOrderSerializer(serializers.Serializer):
     cart_id = serializers.UUIDField()
 
     def validate_cart_id(self,cart_id):
+        # Write-behind cart stores must flush the cart before it is read
+        get_cart_store().persist(cart_id)
         if not Cart.objects.filter(pk=cart_id).exists():
             raise ValidationError("No cart with given ID exists")
         if not CartItem.objects.filter(cart_id=cart_id).exists():
@@ -206,27 +292,42 @@ class CreateOrderSerializer(serializers.Serializer):
 
 
     def save(self, **kwargs):
+        try:
+            return self.place_order()
+        except InsufficientInventory as error:
+            products = Product.objects.filter(id__in=error.product_ids).only('id','title','inventory')
+            raise ValidationError({'cart_id': [
+                f'Only {product.inventory} of product {product.id} ({product.title}) left in stock' for product in products
+            ]})
+
+    def place_order(self):
         with transaction.atomic():
             cart_id = self.validated_data['cart_id']
-            user_id = self.context['user_id']
+            customer_id = get_request_customer_id(self.context['request'])
+            cart_items = list(CartItem.objects.select_related('product').filter(cart_id=cart_id))
 
-            customer = Customer.objects.get(user_id=user_id)
-            order = Order.objects.create(customer=customer)
+            # Fails before anything is written when a product is short
+            Product.objects.reserve_inventory({cart_item.product_id: cart_item.quantity for cart_item in cart_items})
+            # The update skips Product signals, so expire cached product responses here
+            scopes = [caching.ALL_PRODUCTS]
+            for cart_item in cart_items:
+                scopes += [caching.product_scope(cart_item.product_id), caching.collection_scope(cart_item.product.collection_id)]
+            caching.bump_versions_on_commit(*scopes)
 
-            cart_items_qs = CartItem.objects.select_related('product').filter(cart_id=cart_id)
+            order = Order.objects.create(customer_id=customer_id)
 
             order_items = [
                 OrderItem(
-                    order = order, product = cart_item.product, quantity = cart_item.quantity, unit_price = cart_item.product.unit_price
-                ) for cart_item in cart_items_qs
+                    order = order, product = cart_item.product, quantity = cart_item.quantity, unit_price = cart_item.product.effective_price
+                ) for cart_item in cart_items
             ]
 
             OrderItem.objects.bulk_create(order_items)
 
             Cart.objects.filter(id=cart_id).delete()
+            transaction.on_commit(lambda: get_cart_store().discard(cart_id))
 
-            # Sending custom signal (order is created)
-            order_created.send_robust(sender=self.__class__, order=order)
+            # order_created is queued in this transaction and sent by the outbox worker (manage.py process_outbox)
+            outbox.publish('order_created', order=order, payment_status=order.payment_status)
             
             return order
-            
\ No newline at end of file
@@ -1,3 +1,12 @@
 from django.dispatch import Signal
 
-order_created = Signal()
\ No newline at end of file
+# Sent with order and payment_status, the status the order was placed with (the order itself
+# is reloaded by the outbox worker and may have changed since).
+order_created = Signal()
+
+# Sent after bulk writes that bypass the Product model signals, with the ids of the
+# affected products and collections (product_ids, collection_ids).
+products_bulk_updated = Signal()
+
+# Sent with changes=[(order_id, old_payment_status, new_payment_status), ...]
+order_payment_status_changed = Signal()
@@ -1,11 +1,221 @@
 from django.conf import settings
-from store.models import Customer
+from store import caching, outbox, rollups
+from store.customers import forget_customer
+from store.models import Collection, Customer, Order, Product, Promotion, compute_effective_price
+from store.search import get_search_backend
+from store.signals import order_created, order_payment_status_changed, products_bulk_updated
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models import F, Max
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.conf import settings
 
 # A signal handler
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer_for_user(sender,**kwargs):
     if kwargs['created']:
-        Customer.objects.create(user=kwargs['instance'])
\ No newline at end of file
+        Customer.objects.create(user=kwargs['instance'])
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def forget_cached_customer(sender, instance, **kwargs):
+    forget_customer(instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_cached_customer_of_user(sender, instance, **kwargs):
+    forget_customer(instance.pk)
+
+
+# Remember the stored values the post_save handlers below need to compare against.
+@receiver(pre_save, sender=Product)
+def remember_previous_state(sender, instance, **kwargs):
+    instance._previous_state = {}
+    if instance.pk is not None:
+        instance._previous_state = Product.objects \
+            .filter(pk=instance.pk) \
+            .values('collection_id', 'title', 'description', 'unit_price') \
+            .first() or {}
+
+
+# Keep Product.effective_price in sync with unit_price and promotions.
+@receiver(pre_save, sender=Product)
+def set_effective_price(sender, instance, **kwargs):
+    previous_state = getattr(instance, '_previous_state', {})
+    if previous_state and previous_state['unit_price'] == instance.unit_price \
+            and instance.effective_price is not None:
+        return
+    discount = None
+    if instance.pk is not None:
+        discount = instance.promotions.aggregate(discount=Max('discount'))['discount']
+    instance.effective_price = compute_effective_price(instance.unit_price, discount)
+
+
+@receiver(post_save, sender=Promotion)
+def refresh_prices_on_promotion_save(sender, instance, created, **kwargs):
+    if not created:
+        Product.objects.refresh_effective_prices(instance.product_set.values('id'))
+
+
+@receiver(pre_delete, sender=Promotion)
+def remember_promoted_products(sender, instance, **kwargs):
+    instance._promoted_product_ids = list(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Promotion)
+def refresh_prices_on_promotion_delete(sender, instance, **kwargs):
+    Product.objects.refresh_effective_prices(getattr(instance, '_promoted_product_ids', []))
+
+
+@receiver(m2m_changed, sender=Product.promotions.through)
+def refresh_prices_on_promotions_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._promoted_product_ids = list(instance.product_set.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        product_ids = [instance.id]
+    elif action == 'post_clear':
+        product_ids = getattr(instance, '_promoted_product_ids', [])
+    else:
+        product_ids = pk_set
+    Product.objects.refresh_effective_prices(product_ids)
+
+
+# Keep Collection.products_count in sync with the products table.
+@receiver(post_save, sender=Product)
+def update_products_count_on_save(sender, instance, created, raw, **kwargs):
+    # Fixtures (loaddata) carry their own counts
+    if raw:
+        return
+    previous_collection_id = getattr(instance, '_previous_state', {}).get('collection_id')
+    if not created and previous_collection_id == instance.collection_id:
+        return
+    if previous_collection_id is not None:
+        Collection.objects.filter(pk=previous_collection_id) \
+            .update(products_count=F('products_count') - 1)
+    Collection.objects.filter(pk=instance.collection_id) \
+        .update(products_count=F('products_count') + 1)
+
+
+@receiver(post_delete, sender=Product)
+def update_products_count_on_delete(sender, instance, **kwargs):
+    Collection.objects.filter(pk=instance.collection_id, products_count__gt=0) \
+        .update(products_count=F('products_count') - 1)
+
+
+# Keep Customer.orders_count in sync with the orders table. The UPDATEs skip the Customer
+# signals, so the cached customer (store.customers) is forgotten here.
+def change_orders_count(customer_id, delta):
+    customers = Customer.objects.filter(pk=customer_id)
+    if delta < 0:
+        customers = customers.filter(orders_count__gt=0)
+    customers.update(orders_count=F('orders_count') + delta)
+    user_id = Customer.objects.filter(pk=customer_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        forget_customer(user_id)
+
+
+@receiver(post_save, sender=Order)
+def update_orders_count_on_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    previous_customer_id = getattr(instance, '_previous_customer_id', None)
+    if not created and previous_customer_id == instance.customer_id:
+        return
+    if previous_customer_id is not None:
+        change_orders_count(previous_customer_id, -1)
+    change_orders_count(instance.customer_id, 1)
+
+
+@receiver(post_delete, sender=Order)
+def update_orders_count_on_delete(sender, instance, **kwargs):
+    change_orders_count(instance.customer_id, -1)
+
+
+# Keep the product search index up to date.
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, created, **kwargs):
+    previous_state = getattr(instance, '_previous_state', {})
+    if not created and previous_state \
+            and previous_state['title'] == instance.title \
+            and previous_state['description'] == instance.description:
+        return
+    get_search_backend().index([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove([instance.id])
+
+
+# Invalidate cached product responses (see store.caching) once the write commits.
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_product_versions(sender, instance, **kwargs):
+    scopes = [
+        caching.ALL_PRODUCTS,
+        caching.product_scope(instance.id),
+        caching.collection_scope(instance.collection_id),
+    ]
+    previous_collection_id = getattr(instance, '_previous_state', {}).get('collection_id')
+    if previous_collection_id is not None:
+        scopes.append(caching.collection_scope(previous_collection_id))
+    caching.bump_versions_on_commit(*scopes)
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def bump_collection_versions(sender, instance, **kwargs):
+    caching.bump_versions_on_commit(caching.ALL_PRODUCTS, caching.collection_scope(instance.id))
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+@receiver(m2m_changed, sender=Product.promotions.through)
+def bump_promotion_versions(sender, **kwargs):
+    caching.bump_versions_on_commit(caching.PROMOTIONS)
+
+
+# Bring everything derived from products up to date after bulk writes.
+@receiver(products_bulk_updated)
+def refresh_after_bulk_update(sender, product_ids, collection_ids, **kwargs):
+    Collection.objects.refresh_products_count(collection_ids)
+    Product.objects.refresh_effective_prices(product_ids)
+    get_search_backend().index(Product.objects.filter(id__in=product_ids).only('id', 'title', 'description'))
+    caching.bump_versions_on_commit(
+        caching.ALL_PRODUCTS,
+        *[caching.product_scope(product_id) for product_id in product_ids],
+        *[caching.collection_scope(collection_id) for collection_id in collection_ids])
+
+
+# Payment status changes made through Order.save() (API PATCH, admin) are announced through the outbox.
+@receiver(pre_save, sender=Order)
+def remember_previous_order_state(sender, instance, **kwargs):
+    # The previous customer is for update_orders_count_on_save
+    instance._previous_payment_status = instance._previous_customer_id = None
+    if instance.pk is not None:
+        instance._previous_payment_status, instance._previous_customer_id = Order.objects \
+            .filter(pk=instance.pk) \
+            .values_list('payment_status', 'customer_id') \
+            .first() or (None, None)
+
+
+@receiver(post_save, sender=Order)
+def publish_payment_status_change(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_payment_status', None)
+    if not created and previous is not None and previous != instance.payment_status:
+        outbox.publish(
+            'order_payment_status_changed', changes=[(instance.id, previous, instance.payment_status)])
+
+
+# Sales rollups (see store.rollups). These receive the signals from the outbox worker.
+@receiver(order_created)
+def add_order_to_rollups(sender, order, payment_status=None, **kwargs):
+    rollups.record_orders([order.id], payment_status)
+
+
+@receiver(order_payment_status_changed)
+def move_orders_between_rollups(sender, changes, **kwargs):
+    rollups.record_payment_status_changes(changes)
@@ -1,3 +1,878 @@
-from django.test import TestCase
+import importlib
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from uuid import uuid4
 
-# Create your tests here.
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipUnless
+
+from django.core import serializers
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.models import User
+from store import admin_jobs, caching, outbox
+from store.archive import archive_orders
+from store.importers import ProductImporter
+from store.carts import CacheCartStore
+from store.compiled_serializers import CompiledSerializer
+from store.search import InvertedIndexBackend, SQLiteFTS5Backend
+from store.serializers import CartItemSerializer, ProductSerializer
+from store.customers import get_customer
+from store.models import (
+    AdminJob, Cart, CartItem, Collection, Customer, InsufficientInventory, Order, OrderItem, OutboxMessage, Product,
+    Promotion)
+from store.signals import order_created, products_bulk_updated
+
+
+class OrderPaymentStatusTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True))
+        customer = User.objects.create_user('customer', 'customer@example.com', 'pw').customer
+        self.order = Order.objects.create(customer=customer, payment_status=Order.PAYMENT_STATUS_COMPLETE)
+
+    def test_patch_rejects_illegal_transition(self):
+        response = self.client.patch(f'/store/orders/{self.order.id}/', {'payment_status': Order.PAYMENT_STATUS_PENDING})
+        self.assertEqual(response.status_code, 400)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_STATUS_COMPLETE)
+        self.assertFalse(OutboxMessage.objects.filter(event='order_payment_status_changed').exists())
+
+    def test_patch_allows_legal_transition(self):
+        self.order.payment_status = Order.PAYMENT_STATUS_FAILED
+        self.order.save()
+        response = self.client.patch(f'/store/orders/{self.order.id}/', {'payment_status': Order.PAYMENT_STATUS_COMPLETE})
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_STATUS_COMPLETE)
+
+
+class AdminJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        collection = Collection.objects.create(title='Tools')
+        for index in range(5):
+            Product.objects.create(
+                title=f'Product {index}', slug=f'product-{index}', unit_price=Decimal('10.00'),
+                inventory=5 if index < 3 else 50, collection=collection)
+
+    def run_jobs(self):
+        # products_bulk_updated is sent on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            while admin_jobs.run_chunk(chunk_size=2) is not None:
+                pass
+
+    def test_clear_inventory_rebuilds_select_all_from_changelist_filters(self):
+        last_update = Product.objects.order_by('-last_update').values_list('last_update', flat=True).first()
+        job = admin_jobs.enqueue('clear_inventory', {'filters': {'inventory': ['<10']}}, self.user)
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.total, job.processed), (AdminJob.STATUS_DONE, 3, 3))
+        self.assertEqual(Product.objects.filter(inventory=0).count(), 3)
+        self.assertTrue(all(product.last_update > last_update for product in Product.objects.filter(inventory=0)))
+
+    def test_update_prices_on_picked_products(self):
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:2])
+        admin_jobs.enqueue('update_prices', {'pks': product_ids}, self.user, percent='15')
+        self.run_jobs()
+        prices = dict(Product.objects.values_list('id', 'effective_price'))
+        self.assertEqual([prices.pop(product_id) for product_id in product_ids], [Decimal('11.50')] * 2)
+        self.assertEqual(set(prices.values()), {Decimal('10.00')})
+
+
+class DenormalizedCounterTests(TestCase):
+    def test_saving_a_stale_customer_keeps_orders_count(self):
+        user = User.objects.create_user('customer', 'customer@example.com', 'pw')
+        stale = Customer.objects.get(user=user)
+        cached = get_customer(user.id)
+        Order.objects.create(customer=stale)
+        Order.objects.create(customer=stale)
+
+        self.assertEqual(get_customer(user.id).orders_count, 2)
+        self.assertEqual(cached.orders_count, 0)
+        stale.membership = Customer.MEMBERSHIP_GOLD
+        stale.save()
+        customer = Customer.objects.get(pk=stale.pk)
+        self.assertEqual((customer.orders_count, customer.membership), (2, Customer.MEMBERSHIP_GOLD))
+
+    def test_saving_a_stale_collection_keeps_products_count(self):
+        stale = Collection.objects.create(title='Tools')
+        Product.objects.create(title='Hammer', slug='hammer', unit_price=Decimal('10.00'), inventory=1, collection=stale)
+        stale.title = 'Hand tools'
+        stale.save()
+        collection = Collection.objects.get(pk=stale.pk)
+        self.assertEqual((collection.products_count, collection.title), (1, 'Hand tools'))
+
+    def products_counts(self):
+        return list(Collection.objects.order_by('id').values_list('products_count', flat=True))
+
+    def orders_counts(self):
+        return list(Customer.objects.order_by('id').values_list('orders_count', flat=True))
+
+    def test_products_count_follows_create_move_and_delete(self):
+        tools, garden = Collection.objects.create(title='Tools'), Collection.objects.create(title='Garden')
+        hammer, saw = [
+            Product.objects.create(title=title, slug=title.lower(), unit_price=Decimal('10.00'), inventory=1, collection=tools)
+            for title in ['Hammer', 'Saw']
+        ]
+        self.assertEqual(self.products_counts(), [2, 0])
+        saw.collection = garden
+        saw.save()
+        self.assertEqual(self.products_counts(), [1, 1])
+        saw.title = 'Big saw'
+        saw.save()
+        self.assertEqual(self.products_counts(), [1, 1])
+        hammer.delete()
+        saw.delete()
+        self.assertEqual(self.products_counts(), [0, 0])
+
+    def test_orders_count_follows_create_move_and_delete(self):
+        ann, bob = [User.objects.create_user(name, f'{name}@example.com', 'pw').customer for name in ['ann', 'bob']]
+        first, second = Order.objects.create(customer=ann), Order.objects.create(customer=ann)
+        self.assertEqual(self.orders_counts(), [2, 0])
+        second.customer = bob
+        second.save()
+        self.assertEqual(self.orders_counts(), [1, 1])
+        first.payment_status = Order.PAYMENT_STATUS_FAILED
+        first.save()
+        self.assertEqual(self.orders_counts(), [1, 1])
+        first.delete()
+        second.delete()
+        self.assertEqual(self.orders_counts(), [0, 0])
+
+    def test_fixtures_keep_their_counts(self):
+        customer = User.objects.create_user('ann', 'ann@example.com', 'pw').customer
+        fixture = json.dumps([
+            {'model': 'store.collection', 'pk': 100, 'fields': {'title': 'Tools', 'products_count': 1}},
+            {'model': 'store.product', 'pk': 100, 'fields': {
+                'title': 'Hammer', 'slug': 'hammer', 'unit_price': '10.00', 'inventory': 1,
+                'effective_price': '10.00', 'collection': 100, 'last_update': '2026-01-01T00:00:00Z'}},
+            {'model': 'store.order', 'pk': 100, 'fields': {
+                'customer': customer.id, 'payment_status': 'P', 'placed_at': '2026-01-01T00:00:00Z'}},
+        ])
+        for loaded in serializers.deserialize('json', fixture):
+            loaded.save()
+        self.assertEqual(Collection.objects.get(pk=100).products_count, 1)
+        self.assertEqual(Customer.objects.get(pk=customer.pk).orders_count, 0)
+
+
+class OrderQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        collection = Collection.objects.create(title='Tools')
+        products = [
+            Product.objects.create(
+                title=f'Product {index}', slug=f'product-{index}', unit_price=Decimal('10.00'),
+                inventory=10, collection=collection)
+            for index in range(3)
+        ]
+        self.user = User.objects.create_user('customer', 'customer@example.com', 'pw')
+        for _ in range(5):
+            order = Order.objects.create(customer=self.user.customer)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=1, unit_price=product.unit_price)
+                for product in products
+            ])
+        self.order = order
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list(self):
+        # customer id, orders, items with their products
+        with self.assertNumQueries(3):
+            response = self.client.get('/store/orders/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual({len(order['orderitem_set']) for order in response.data}, {3})
+
+    def test_cursor_page(self):
+        self.client.get('/store/orders/')
+        # The customer id is cached now
+        with self.assertNumQueries(2):
+            response = self.client.get('/store/orders/?cursor=')
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual({len(order['orderitem_set']) for order in response.data['results']}, {3})
+
+    def test_retrieve(self):
+        self.client.get('/store/orders/')
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/store/orders/{self.order.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['orderitem_set']), 3)
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        collection = Collection.objects.create(title='Tools')
+        for index in range(12):
+            Product.objects.create(
+                title=f'Product {11 - index:02}', slug=f'product-{index}', unit_price=Decimal('10.00'),
+                inventory=10, collection=collection)
+
+    def test_products_are_paginated_by_page_number_by_default(self):
+        response = self.client.get('/store/products/?page=2')
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual([product['title'] for product in response.data['results']], ['Product 10', 'Product 11'])
+
+    def test_products_cursor_pagination_is_opt_in(self):
+        response = self.client.get('/store/products/?cursor=')
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 10)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+
+
+class OutboxTests(TestCase):
+    def test_failing_message_is_retried_alone(self):
+        customer = User.objects.create_user('customer', 'customer@example.com', 'pw').customer
+        orders = [Order.objects.create(customer=customer) for _ in range(3)]
+        for order in orders:
+            outbox.publish('order_created', order=order)
+        delivered = []
+
+        def receiver(sender, order, **kwargs):
+            if order == orders[1]:
+                raise RuntimeError('receiver failed')
+            delivered.append(order)
+        order_created.connect(receiver)
+        self.addCleanup(order_created.disconnect, receiver)
+
+        outbox.process_batch()
+        self.assertEqual(delivered, [orders[0], orders[2]])
+        failed = OutboxMessage.objects.get(processed_at__isnull=True)
+        self.assertIn('receiver failed', failed.last_error)
+        # Leased and then backed off, so not claimed again right away
+        self.assertEqual(outbox.claim_batch(), [])
+
+
+class OrderExportTests(TestCase):
+    def test_export_includes_archived_orders(self):
+        collection = Collection.objects.create(title='Tools')
+        product = Product.objects.create(
+            title='Hammer', slug='hammer', unit_price=Decimal('10.00'), inventory=10, collection=collection)
+        customer = User.objects.create_user('customer', 'customer@example.com', 'pw').customer
+        orders = [Order.objects.create(customer=customer) for _ in range(3)]
+        for order in orders:
+            OrderItem.objects.create(order=order, product=product, quantity=2, unit_price=product.unit_price)
+        archive_orders(older_than=timedelta(0), pause=0)
+        self.assertEqual(Order.objects.count(), 1)
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True))
+        response = client.get('/store/orders/export/')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([line['id'] for line in lines], [order.id for order in orders])
+        self.assertEqual({len(line['items']) for line in lines}, {1})
+        response = client.get('/store/orders/export/?export_format=csv')
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 4)
+
+
+class CacheCartStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        collection = Collection.objects.create(title='Tools')
+        self.products = [
+            Product.objects.create(
+                title=f'Product {index}', slug=f'product-{index}', unit_price=Decimal('10.00'),
+                inventory=10, collection=collection)
+            for index in range(3)
+        ]
+        self.store = CacheCartStore()
+
+    def cart_items(self, state):
+        return dict(CartItem.objects.filter(cart_id=state['id']).values_list('product_id', 'quantity'))
+
+    def test_changes_only_touch_the_cache(self):
+        with self.assertNumQueries(0):
+            state = self.store.create()
+            self.store.add_items(state, [(self.products[0].id, 1)])
+            self.store.set_item_quantity(state, self.products[0].id, 3)
+        self.assertEqual(self.store.get(state['id'])['items'], {self.products[0].id: 3})
+
+    def test_every_changed_cart_is_flushed(self):
+        states = [self.store.create() for _ in range(3)]
+        for state in states:
+            self.store.add_items(state, [(self.products[0].id, 1)])
+        self.assertEqual(self.store.flush(batch_size=2), 3)
+        self.assertEqual(Cart.objects.count(), 3)
+        self.assertEqual(self.store.flush(), 0)
+
+    def test_change_during_flush_is_flushed_next_time(self):
+        state = self.store.create()
+        self.store.add_items(state, [(self.products[0].id, 1)])
+        write_states = self.store.write_states
+
+        def write_then_change(states):
+            write_states(states)
+            # Another request changes the cart after the flush read it
+            self.store.add_items(self.store.get(state['id']), [(self.products[1].id, 2)])
+
+        with mock.patch.object(self.store, 'write_states', write_then_change):
+            self.store.flush()
+        self.assertEqual(self.cart_items(state), {self.products[0].id: 1})
+
+        self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(self.cart_items(state), {self.products[0].id: 1, self.products[1].id: 2})
+
+    def test_failed_flush_keeps_carts_dirty(self):
+        state = self.store.create()
+        self.store.add_items(state, [(self.products[0].id, 1)])
+        with mock.patch.object(self.store, 'write_states', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.store.flush()
+        self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(self.cart_items(state), {self.products[0].id: 1})
+
+    def test_cart_evicted_before_flush_is_logged_and_kept(self):
+        state = self.store.create()
+        self.store.add_items(state, [(self.products[0].id, 1)])
+        self.store.flush()
+        self.store.add_items(state, [(self.products[1].id, 1)])
+        cache.delete(self.store.get_key(state['id']))
+
+        with self.assertLogs('store.carts', 'WARNING') as logs:
+            self.store.flush()
+        self.assertIn(state['id'], logs.output[0])
+        self.assertEqual(self.cart_items(state), {self.products[0].id: 1})
+        self.assertEqual(self.store.get(state['id'])['items'], {self.products[0].id: 1})
+
+    def test_discarded_cart_is_not_flushed(self):
+        state = self.store.create()
+        self.store.add_items(state, [(self.products[0].id, 1)])
+        self.store.discard(state['id'])
+        self.assertEqual(self.store.flush(), 0)
+
+    def test_deleted_product_is_dropped(self):
+        state = self.store.create()
+        other = self.store.create()
+        self.store.add_items(state, [(self.products[0].id, 1), (self.products[2].id, 1)])
+        self.store.add_items(other, [(self.products[1].id, 1)])
+        self.products[2].delete()
+        self.store.flush()
+        self.assertEqual(self.cart_items(state), {self.products[0].id: 1})
+        self.assertEqual(self.cart_items(other), {self.products[1].id: 1})
+
+
+class ConcurrentCacheCartChangeTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        collection = Collection.objects.create(title='Tools')
+        self.product = Product.objects.create(
+            title='Hammer', slug='hammer', unit_price=Decimal('10.00'), inventory=10, collection=collection)
+        self.store = CacheCartStore()
+
+    def run_threads(self, function, arguments):
+        def run(argument):
+            try:
+                function(argument)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(run, arguments))
+
+    def test_concurrent_adds_to_one_cart_are_all_kept(self):
+        cart_id = self.store.create()['id']
+        read = self.store.read
+
+        def slow_read(cart_id):
+            # Widens the window between reading and saving a cart
+            state = read(cart_id)
+            time.sleep(0.002)
+            return state
+
+        self.store.read = slow_read
+        self.run_threads(lambda _: self.store.add_items(self.store.get(cart_id), [(self.product.id, 1)]), range(40))
+        self.assertEqual(self.store.get(cart_id)['items'], {self.product.id: 40})
+        self.store.flush()
+        self.assertEqual(CartItem.objects.get(cart_id=cart_id).quantity, 40)
+
+    def test_concurrent_changes_to_many_carts_are_all_flushed(self):
+        states = [self.store.create() for _ in range(20)]
+        self.run_threads(lambda state: self.store.add_items(state, [(self.product.id, 1)]), states)
+        self.assertEqual(self.store.flush(), 20)
+        self.assertEqual(CartItem.objects.count(), 20)
+
+
+class InvertedIndexSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tools = Collection.objects.create(title='Tools')
+        garden = Collection.objects.create(title='Garden')
+        descriptions = ['red hammer', 'blue hammer hammer', 'red saw', 'red blue rake', 'red hose']
+        for index, description in enumerate(descriptions):
+            Product.objects.create(
+                title=f'Product {index}', slug=f'product-{index}', description=description,
+                unit_price=Decimal('10.00'), inventory=10, collection=tools if index < 3 else garden)
+        self.backend = InvertedIndexBackend()
+        self.backend.rebuild()
+
+    def ranked_titles(self, queryset, query):
+        return [product.title for product in self.backend.search(queryset, query)]
+
+    def test_filters_do_not_change_relative_ranking(self):
+        everything = self.ranked_titles(Product.objects.all(), 'hammer blue')
+        tools = self.ranked_titles(Product.objects.filter(collection__title='Tools'), 'hammer blue')
+        self.assertEqual(everything[:2], ['Product 1', 'Product 0'])
+        self.assertEqual(tools, [title for title in everything if title in tools])
+
+    def test_terms_in_too_many_products_are_left_out(self):
+        self.backend.max_term_documents = 3
+        # 'red' is in 4 products, so only 'saw' ranks
+        self.assertEqual(self.ranked_titles(Product.objects.all(), 'red saw'), ['Product 2'])
+        # Unless it is the only term
+        self.assertEqual(len(self.ranked_titles(Product.objects.all(), 'red')), 4)
+
+    def test_migration_fills_the_index_of_the_existing_catalog(self):
+        self.backend.clear()
+        self.assertEqual(self.ranked_titles(Product.objects.all(), 'saw'), [])
+        migration = importlib.import_module('store.migrations.0014_fill_product_search_index')
+        migration.rebuild_search_index(None, None)
+        self.assertEqual(self.ranked_titles(Product.objects.all(), 'saw'), ['Product 2'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5 only')
+class SQLiteFTS5SearchTests(TestCase):
+    def test_limit_counts_only_filtered_products(self):
+        tools = Collection.objects.create(title='Tools')
+        garden = Collection.objects.create(title='Garden')
+        for index in range(5):
+            Product.objects.create(
+                title=f'Product {index}', slug=f'product-{index}', description='red hammer' if index < 3 else 'red',
+                unit_price=Decimal('10.00'), inventory=10, collection=tools if index < 3 else garden)
+        backend = SQLiteFTS5Backend()
+        backend.rebuild()
+        backend.max_results = 2
+        # The three tools products rank above the garden ones
+        results = backend.search(Product.objects.filter(collection=garden), 'red hammer')
+        self.assertEqual(sorted(product.title for product in results), ['Product 3', 'Product 4'])
+
+
+class CachedResponseInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.collection = Collection.objects.create(title='Tools')
+        self.product = Product.objects.create(
+            title='Hammer', slug='hammer', unit_price=Decimal('10.00'), inventory=10, collection=self.collection)
+
+    def get_product(self):
+        listed = self.client.get('/store/products/').json()['results'][0]
+        detail = self.client.get(f'/store/products/{self.product.id}/').json()
+        return listed, detail
+
+    def test_versions_are_bumped_when_the_write_commits(self):
+        versions = caching.get_versions([caching.ALL_PRODUCTS])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.title = 'Mallet'
+            self.product.save()
+            self.assertEqual(caching.get_versions([caching.ALL_PRODUCTS]), versions)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(caching.get_versions([caching.ALL_PRODUCTS]), versions)
+
+    def test_product_write_invalidates_list_and_detail(self):
+        self.get_product()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.title = 'Mallet'
+            self.product.save()
+        listed, detail = self.get_product()
+        self.assertEqual(listed['title'], 'Mallet')
+        self.assertEqual(detail['title'], 'Mallet')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertEqual(self.client.get('/store/products/').json()['results'], [])
+
+    def test_collection_write_invalidates_list_and_detail(self):
+        self.client.get('/store/collections/')
+        self.client.get(f'/store/collections/{self.collection.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.collection.title = 'Hardware'
+            self.collection.save()
+        self.assertEqual(self.client.get('/store/collections/').json()[0]['title'], 'Hardware')
+        self.assertEqual(self.client.get(f'/store/collections/{self.collection.id}/').json()['title'], 'Hardware')
+
+    def test_promotion_write_invalidates_list_and_detail(self):
+        self.get_product()
+        with self.captureOnCommitCallbacks(execute=True):
+            promotion = Promotion.objects.create(description='Sale', discount=0.5)
+            self.product.promotions.add(promotion)
+        listed, detail = self.get_product()
+        self.assertEqual(listed['effective_price'], 5.0)
+        self.assertEqual(detail['effective_price'], 5.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            promotion.discount = 0.2
+            promotion.save()
+        listed, detail = self.get_product()
+        self.assertEqual(listed['effective_price'], 8.0)
+        self.assertEqual(detail['effective_price'], 8.0)
+
+
+class ConditionalProductResponseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        collection = Collection.objects.create(title='Tools')
+        self.products = [
+            Product.objects.create(
+                title=f'Product {index}', slug=f'product-{index}', unit_price=Decimal('10.00'),
+                inventory=10, collection=collection)
+            for index in range(2)
+        ]
+
+    def test_list_not_modified(self):
+        etag = self.client.get('/store/products/')['ETag']
+        response = self.client.get('/store/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_changes_after_update(self):
+        etag = self.client.get('/store/products/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].title = 'Hammer'
+            self.products[0].save()
+        response = self.client.get('/store/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_changes_after_deleting_an_older_product(self):
+        response = self.client.get('/store/products/')
+        self.assertNotIn('Last-Modified', response)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].delete()
+        response = self.client.get('/store/products/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_list_ignores_if_modified_since(self):
+        response = self.client.get('/store/products/', HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_not_modified_until_updated(self):
+        url = f'/store/products/{self.products[0].id}/'
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].title = 'Hammer'
+            self.products[0].save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class InventoryReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        collection = Collection.objects.create(title='Tools')
+        self.hammer, self.saw = [
+            Product.objects.create(
+                title=title, slug=title.lower(), unit_price=Decimal('10.00'), inventory=5, collection=collection)
+            for title in ['Hammer', 'Saw']
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('customer', 'customer@example.com', 'pw'))
+
+    def inventory(self):
+        return dict(Product.objects.values_list('id', 'inventory'))
+
+    def test_reserve_below_and_at_inventory(self):
+        Product.objects.reserve_inventory({self.hammer.id: 2, self.saw.id: 5})
+        self.assertEqual(self.inventory(), {self.hammer.id: 3, self.saw.id: 0})
+
+    def test_reserve_above_inventory_takes_nothing(self):
+        with self.assertRaises(InsufficientInventory) as raised:
+            Product.objects.reserve_inventory({self.hammer.id: 2, self.saw.id: 6})
+        self.assertEqual(raised.exception.product_ids, [self.saw.id])
+        self.assertEqual(self.inventory(), {self.hammer.id: 5, self.saw.id: 5})
+
+    def test_reserve_unknown_product_takes_nothing(self):
+        with self.assertRaises(InsufficientInventory):
+            Product.objects.reserve_inventory({self.hammer.id: 1, 0: 1})
+        self.assertEqual(self.inventory()[self.hammer.id], 5)
+
+    def checkout(self, quantities):
+        cart = Cart.objects.create()
+        CartItem.objects.add_items(cart.id, list(quantities.items()))
+        return self.client.post('/store/orders/', {'cart_id': str(cart.id)}), cart
+
+    def test_checkout_takes_stock_of_every_product(self):
+        response, _ = self.checkout({self.hammer.id: 5, self.saw.id: 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.inventory(), {self.hammer.id: 0, self.saw.id: 4})
+
+    def test_checkout_short_of_stock_is_rejected_and_rolled_back(self):
+        response, cart = self.checkout({self.hammer.id: 1, self.saw.id: 6})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Only 5 of product', response.data['cart_id'][0])
+        self.assertEqual(self.inventory(), {self.hammer.id: 5, self.saw.id: 5})
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(Cart.objects.filter(id=cart.id).exists())
+
+    def test_checkouts_never_oversell(self):
+        for _ in range(5):
+            self.assertEqual(self.checkout({self.hammer.id: 1})[0].status_code, 200)
+        response, _ = self.checkout({self.hammer.id: 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.inventory()[self.hammer.id], 0)
+
+
+class ConcurrentInventoryReservationTests(TransactionTestCase):
+    def test_concurrent_reservations_never_oversell(self):
+        collection = Collection.objects.create(title='Tools')
+        product = Product.objects.create(
+            title='Hammer', slug='hammer', unit_price=Decimal('10.00'), inventory=10, collection=collection)
+
+        def reserve(_):
+            try:
+                Product.objects.reserve_inventory({product.id: 1})
+                return 'reserved'
+            except InsufficientInventory:
+                return 'short'
+            except DatabaseError:
+                # SQLite fails writers it can't serialize
+                return 'failed'
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(reserve, range(30)))
+        product.refresh_from_db()
+        self.assertLessEqual(results.count('reserved'), 10)
+        self.assertEqual(product.inventory, 10 - results.count('reserved'))
+
+
+class AddCartItemTests(TestCase):
+    def setUp(self):
+        collection = Collection.objects.create(title='Tools')
+        self.product = Product.objects.create(
+            title='Hammer', slug='hammer', unit_price=Decimal('10.00'), inventory=10, collection=collection)
+        self.cart = Cart.objects.create()
+        self.client = APIClient()
+
+    def add(self, cart_id, data):
+        return self.client.post(f'/store/carts/{cart_id}/items/', data, format='json')
+
+    def test_adding_again_increments_the_quantity(self):
+        self.assertEqual(self.add(self.cart.id, {'product_id': self.product.id, 'quantity': 2}).status_code, 201)
+        response = self.add(self.cart.id, [{'product_id': self.product.id, 'quantity': 3}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data[0]['quantity'], 5)
+
+    def test_unknown_cart(self):
+        response = self.add(uuid4(), {'product_id': self.product.id, 'quantity': 1})
+        self.assertEqual(response.status_code, 404)
+        # The transaction is still usable
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_unknown_product(self):
+        response = self.add(self.cart.id, [
+            {'product_id': self.product.id, 'quantity': 1}, {'product_id': self.product.id + 1, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('product_id', response.data)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class ProductImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.collection = Collection.objects.create(title='Tools')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True))
+
+    def import_csv(self, lines):
+        body = 'title,description,unit_price,inventory,collection\n' + ''.join(f'{line}\n' for line in lines)
+        return self.client.generic('POST', '/store/products/import/', body, content_type='text/csv')
+
+    def test_reimport_updates_instead_of_duplicating(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.import_csv([f'Claw Hammer,,10.00,5,{self.collection.id}', f'Saw,,20.00,1,{self.collection.id}'])
+        self.assertEqual((response.data['created'], response.data['updated']), (2, 0))
+        response = self.import_csv([f'Claw Hammer,Heavy,12.00,7,{self.collection.id}', 'Rake,,5.00,1,999'])
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['failed']), (0, 1, 1))
+        self.assertEqual(Product.objects.count(), 2)
+        hammer = Product.objects.get(slug='Claw-Hammer')
+        self.assertEqual((hammer.unit_price, hammer.effective_price, hammer.inventory), (Decimal('12.00'), Decimal('12.00'), 7))
+        self.assertEqual(Collection.objects.get(id=self.collection.id).products_count, 2)
+
+    def test_failing_receiver_is_logged(self):
+        def fail(**kwargs):
+            raise RuntimeError('index down')
+
+        products_bulk_updated.connect(fail, dispatch_uid='test_failing_receiver')
+        try:
+            with self.assertLogs('store.importers', 'ERROR') as logs:
+                report = ProductImporter().run([
+                    {'title': 'Saw', 'unit_price': '20.00', 'inventory': 1, 'collection': self.collection.id}])
+        finally:
+            products_bulk_updated.disconnect(dispatch_uid='test_failing_receiver')
+        self.assertEqual(report['created'], 1)
+        self.assertIn('fail', logs.output[0])
+
+    def test_slug_is_unique(self):
+        self.client.post('/store/products/', {
+            'title': 'Saw', 'unit_price': '20.00', 'inventory': 1, 'collection': self.collection.id})
+        response = self.client.post('/store/products/', {
+            'title': 'Saw', 'unit_price': '25.00', 'inventory': 1, 'collection': self.collection.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Product.objects.filter(slug='Saw').count(), 1)
+
+
+class CompiledSerializerTests(TestCase):
+    def setUp(self):
+        collection = Collection.objects.create(title='Tools')
+        promotion = Promotion.objects.create(description='Sale', discount=0.15)
+        self.products = [
+            Product.objects.create(
+                title=f'Product {index}', slug=f'product-{index}', unit_price=unit_price, inventory=index,
+                description=description, collection=collection)
+            for index, (unit_price, description) in enumerate([
+                (Decimal('10.00'), None), (Decimal('9.99'), ''), (Decimal('1234.50'), 'Sturdy')])
+        ]
+        self.products[1].promotions.add(promotion)
+        self.cart = Cart.objects.create()
+        CartItem.objects.add_items(self.cart.id, [(product.id, index + 1) for index, product in enumerate(self.products)])
+
+    def assert_same_json(self, serializer_class, queryset):
+        regular = serializer_class(queryset, many=True).data
+        compiled = CompiledSerializer(serializer_class(many=True).child)
+        rows = compiled.to_representation(compiled.get_queryset(queryset))
+        self.assertEqual(JSONRenderer().render(rows), JSONRenderer().render(regular))
+
+    def test_products(self):
+        self.assert_same_json(ProductSerializer, Product.objects.all())
+
+    def test_cart_items(self):
+        self.assert_same_json(
+            CartItemSerializer, CartItem.objects.with_total_price().select_related('product').filter(cart=self.cart))
+
+    def test_list_endpoints_match_the_serializers(self):
+        client = APIClient()
+        response = client.get('/store/products/')
+        regular = ProductSerializer(Product.objects.all(), many=True).data
+        self.assertEqual(JSONRenderer().render(response.data['results']), JSONRenderer().render(regular))
+        response = client.get(f'/store/carts/{self.cart.id}/items/')
+        regular = CartItemSerializer(
+            CartItem.objects.with_total_price().select_related('product').filter(cart=self.cart), many=True).data
+        self.assertEqual(JSONRenderer().render(response.data), JSONRenderer().render(regular))
+
+
+class CartTotalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        collection = Collection.objects.create(title='Tools')
+        self.hammer, self.saw = [
+            Product.objects.create(
+                title=title, slug=title.lower(), unit_price=unit_price, inventory=10, collection=collection)
+            for title, unit_price in [('Hammer', Decimal('10.00')), ('Saw', Decimal('25.00'))]
+        ]
+        self.hammer.promotions.add(Promotion.objects.create(description='Sale', discount=0.2))
+        self.cart = Cart.objects.create()
+        CartItem.objects.add_items(self.cart.id, [(self.hammer.id, 2), (self.saw.id, 1)])
+        self.client = APIClient()
+
+    def test_totals_use_effective_prices(self):
+        cart = self.client.get(f'/store/carts/{self.cart.id}/').json()
+        self.assertEqual(cart['total_price'], 41.0)
+        self.assertEqual(
+            {item['product']['title']: item['total_price'] for item in cart['items']}, {'Hammer': 16.0, 'Saw': 25.0})
+        summary = self.client.get(f'/store/carts/{self.cart.id}/summary/').json()
+        self.assertEqual(
+            (summary['items_count'], summary['total_quantity'], summary['total_price']), (2, 3, 41.0))
+        items = self.client.get(f'/store/carts/{self.cart.id}/items/').json()
+        self.assertEqual(sorted(item['total_price'] for item in items), [16.0, 25.0])
+
+    def test_empty_cart(self):
+        summary = self.client.get(f'/store/carts/{Cart.objects.create().id}/summary/').json()
+        self.assertEqual((summary['items_count'], summary['total_quantity'], summary['total_price']), (0, 0, 0))
+
+    def test_summary_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.client.get(f'/store/carts/{self.cart.id}/summary/')
+
+    def test_order_costs_the_cart_total(self):
+        cart_total = Decimal(str(self.client.get(f'/store/carts/{self.cart.id}/summary/').json()['total_price']))
+        self.client.force_authenticate(User.objects.create_user('customer', 'customer@example.com', 'pw'))
+        self.client.post('/store/orders/', {'cart_id': str(self.cart.id)})
+        order_total = sum(item.quantity * item.unit_price for item in OrderItem.objects.all())
+        self.assertEqual(order_total, cart_total)
+
+
+class EffectivePriceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.collection = Collection.objects.create(title='Tools')
+        self.hammer = self.create_product('Hammer', Decimal('10.00'))
+        self.saw = self.create_product('Saw', Decimal('40.00'))
+
+    def create_product(self, title, unit_price):
+        return Product.objects.create(
+            title=title, slug=title.lower(), unit_price=unit_price, inventory=10, collection=self.collection)
+
+    def effective_price(self, product):
+        return Product.objects.values_list('effective_price', flat=True).get(id=product.id)
+
+    def test_new_product_is_at_unit_price(self):
+        self.assertEqual(self.effective_price(self.hammer), Decimal('10.00'))
+
+    def test_best_promotion_applies(self):
+        self.hammer.promotions.add(
+            Promotion.objects.create(description='Small', discount=0.1),
+            Promotion.objects.create(description='Big', discount=0.25))
+        self.assertEqual(self.effective_price(self.hammer), Decimal('7.50'))
+        self.assertEqual(self.effective_price(self.saw), Decimal('40.00'))
+
+    def test_unit_price_change_keeps_promotion(self):
+        self.hammer.promotions.add(Promotion.objects.create(description='Sale', discount=0.5))
+        self.hammer.refresh_from_db()
+        self.hammer.unit_price = Decimal('20.00')
+        self.hammer.save()
+        self.assertEqual(self.effective_price(self.hammer), Decimal('10.00'))
+
+    def test_promotion_changes_refresh_prices(self):
+        promotion = Promotion.objects.create(description='Sale', discount=0.5)
+        promotion.product_set.add(self.hammer, self.saw)
+        self.assertEqual((self.effective_price(self.hammer), self.effective_price(self.saw)),
+                         (Decimal('5.00'), Decimal('20.00')))
+
+        promotion.discount = 0.2
+        promotion.save()
+        self.assertEqual(self.effective_price(self.saw), Decimal('32.00'))
+
+        promotion.product_set.remove(self.saw)
+        self.assertEqual(self.effective_price(self.saw), Decimal('40.00'))
+
+        promotion.product_set.clear()
+        self.assertEqual(self.effective_price(self.hammer), Decimal('10.00'))
+
+    def test_promotion_delete_refreshes_prices(self):
+        promotion = Promotion.objects.create(description='Sale', discount=0.5)
+        self.hammer.promotions.add(promotion)
+        promotion.delete()
+        self.assertEqual(self.effective_price(self.hammer), Decimal('10.00'))
+
+    def test_bulk_update_refreshes_prices(self):
+        self.hammer.promotions.add(Promotion.objects.create(description='Sale', discount=0.5))
+        Product.objects.filter(id=self.hammer.id).update(unit_price=Decimal('30.00'))
+        products_bulk_updated.send(sender=Product, product_ids=[self.hammer.id], collection_ids=[])
+        self.assertEqual(self.effective_price(self.hammer), Decimal('15.00'))
+
+    def test_filter_on_effective_price(self):
+        self.saw.promotions.add(Promotion.objects.create(description='Sale', discount=0.9))
+        response = APIClient().get('/store/products/', {'effective_price__lt': 5})
+        self.assertEqual([product['title'] for product in response.json()['results']], ['Saw'])
+
+    def test_checkout_charges_effective_price(self):
+        self.hammer.promotions.add(Promotion.objects.create(description='Sale', discount=0.3))
+        cart = Cart.objects.create()
+        CartItem.objects.add_items(cart.id, [(self.hammer.id, 1)])
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('customer', 'customer@example.com', 'pw'))
+        client.post('/store/orders/', {'cart_id': str(cart.id)})
+        self.assertEqual(OrderItem.objects.get().unit_price, Decimal('7.00'))
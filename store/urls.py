@@ -4,6 +4,7 @@ from django.urls import path, include
 from rest_framework import urlpatterns
 # from rest_framework import routers
 from . import views
+from .carts import get_cart_store
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested import routers
 
@@ -22,10 +23,18 @@ router.register('customers',views.CustomerViewSet)
 # If we don't specify this attribute in viewset, then specify basename manually here
 router.register('orders',views.OrderViewSet,basename='orders')
 
-router.register('carts',views.CartViewSet,basename='carts')
+router.register('reports',views.SalesReportViewSet,basename='reports')
+
+# Carts kept in a write-behind cache store get the cache-backed viewsets (same API)
+if get_cart_store().uses_database:
+    cart_viewset, cart_item_viewset = views.CartViewSet, views.CartItemViewSet
+else:
+    cart_viewset, cart_item_viewset = views.CacheCartViewSet, views.CacheCartItemViewSet
+
+router.register('carts',cart_viewset,basename='carts')
 
 carts_router = routers.NestedDefaultRouter(router,'carts',lookup='cart')
-carts_router.register('items',views.CartItemViewSet,basename='cart-items')
+carts_router.register('items',cart_item_viewset,basename='cart-items')
 
 
 urlpatterns = router.urls + products_router.urls + carts_router.urls
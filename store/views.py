@@ -1,7 +1,9 @@
+from django.db import transaction
+from django.db.models import Prefetch, Sum
 from django.db.models.query import QuerySet
-from django.http import request
+from django.http import Http404, request, StreamingHttpResponse
 from django.shortcuts import render,get_object_or_404
-from rest_framework import permissions
+from rest_framework import generics, permissions
 
 from rest_framework.decorators import api_view,action, permission_classes
 from rest_framework.views import APIView
@@ -9,26 +11,34 @@ from rest_framework.response import Response
 from rest_framework import serializers, status
 from rest_framework.mixins import ListModelMixin,CreateModelMixin,UpdateModelMixin,DestroyModelMixin,RetrieveModelMixin
 from rest_framework.generics import CreateAPIView, ListCreateAPIView, RetrieveDestroyAPIView,RetrieveUpdateDestroyAPIView
-from rest_framework.viewsets import GenericViewSet, ModelViewSet
+from rest_framework.viewsets import GenericViewSet, ModelViewSet, ViewSet
 from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.permissions import OR, IsAdminUser, IsAuthenticated
 
 from django_filters.rest_framework import DjangoFilterBackend
 
-from store.filters import ProductFilter
-from store.pagination import DefaultPagination
+from store import outbox
+from store.carts import get_cart_store
+from store.customers import get_request_customer, get_request_customer_id
+from store.caching import CachedProductResponseMixin, VersionedETagMixin
+from store.compiled_serializers import CompiledListMixin
+from store.fieldsets import SparseFieldsetMixin
+from store.exporters import export_orders_csv, export_orders_ndjson
+from store.filters import CollectionSalesRollupFilter, OrderFilter, ProductFilter, ProductSalesRollupFilter, ProductSearchFilter
+from store.importers import ProductImporter, read_csv_rows, read_ndjson_rows
+from store.pagination import CursorOptInPagination, ProductPagination
 from store.permissions import IsAdminOrReadOnly
-from store.serializers import AddCartItemSerializer, CartItemSerializer, CartSerializer, CollectionSerializer, CreateOrderSerializer, CustomerSerializer, OrderSerializer, ProductSerializer, ReviewSerializer, SimpleProductSerializer, UpdateCartItemSerializer, UpdateOrderSerializer
-from .models import Cart, CartItem, Collection, Customer, Order, OrderItem, Product, Review
+from store.serializers import AddCartItemSerializer, CartItemSerializer, CartSerializer, CartSummarySerializer, CollectionSerializer, CreateOrderSerializer, CustomerSerializer, OrderSerializer, PaymentStatusChangeSerializer, ProductSerializer, ReviewSerializer, SimpleProductSerializer, UpdateCartItemSerializer, UpdateOrderSerializer
+from .models import ArchivedOrder, ArchivedOrderItem, Cart, CartItem, Collection, CollectionSalesRollup, Customer, Order, OrderItem, PaymentStatusTransitionError, Product, ProductSalesRollup, Review
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(SparseFieldsetMixin,CachedProductResponseMixin,CompiledListMixin,ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
     # Filtering using django_filters library
-    filter_backends = [DjangoFilterBackend,SearchFilter,OrderingFilter]
+    filter_backends = [DjangoFilterBackend,ProductSearchFilter,OrderingFilter]
     filterset_class = ProductFilter
-    pagination_class = DefaultPagination
+    pagination_class = ProductPagination
     search_fields = ['title','description']
     ordering_fields = ['unit_price','last_update']
     permission_classes = [IsAdminOrReadOnly]
@@ -38,12 +48,30 @@ class ProductViewSet(ModelViewSet):
         return {'request',self.request}
 
     def destroy(self, request, *args, **kwargs):
-        if OrderItem.objects.filter(product_id=kwargs['pk']).exists():
+        if OrderItem.objects.filter(product_id=kwargs['pk']).exists() or ArchivedOrderItem.objects.filter(product_id=kwargs['pk']).exists():
             return Response({'error':'Cannot delete product as it has order items associated with it'},status=status.HTTP_405_METHOD_NOT_ALLOWED)
         return super().destroy(request, *args, **kwargs)
 
+    # Bulk upsert by slug. The body (text/csv or application/x-ndjson) is read line by line
+    # from the request stream instead of being parsed into memory as a whole.
+    @action(detail=False,methods=['POST'],url_path='import',permission_classes=[IsAdminUser])
+    def bulk_import(self,request):
+        readers = {
+            'text/csv': read_csv_rows,
+            'application/x-ndjson': read_ndjson_rows,
+            'application/jsonl': read_ndjson_rows,
+        }
+        content_type = request.content_type.split(';')[0].strip()
+        if content_type not in readers:
+            return Response({'error':f'Unsupported content type. Use one of: {", ".join(readers)}'},status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        stream = request.stream
+        lines = (line.decode('utf-8') for line in iter(stream.readline, b'')) if stream is not None else iter(())
+        report = ProductImporter().run(readers[content_type](lines))
+        return Response(report)
+
 
-class CollectionViewSet(ModelViewSet):
+class CollectionViewSet(SparseFieldsetMixin,VersionedETagMixin,ModelViewSet):
     queryset = Collection.objects.all()
     serializer_class = CollectionSerializer
     permission_classes = [IsAdminOrReadOnly]
@@ -54,8 +82,11 @@ class CollectionViewSet(ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
-class ReviewViewSet(ModelViewSet):
+class ReviewViewSet(SparseFieldsetMixin,ModelViewSet):
     serializer_class = ReviewSerializer
+    pagination_class = CursorOptInPagination
+    # Order of ?cursor= pages
+    ordering = ['-date']
 
     def get_queryset(self):
         return Review.objects.filter(product_id = self.kwargs['product_pk'])
@@ -64,14 +95,28 @@ class ReviewViewSet(ModelViewSet):
         return {'product_id': self.kwargs['product_pk']}
 
 
-class CartViewSet(CreateModelMixin,RetrieveModelMixin,DestroyModelMixin,GenericViewSet):
-    queryset = Cart.objects.prefetch_related('items','items__product').all()
+class CartViewSet(SparseFieldsetMixin,CreateModelMixin,RetrieveModelMixin,DestroyModelMixin,GenericViewSet):
+    # Totals are summed by the database instead of over the prefetched items
+    queryset = Cart.objects.with_totals().prefetch_related(
+        Prefetch('items',queryset=CartItem.objects.with_total_price().select_related('product')))
     serializer_class = CartSerializer
 
-class CartItemViewSet(ModelViewSet):
+    @action(detail=True,methods=['GET'])
+    def summary(self,request,pk=None):
+        # Totals only, from a single aggregate query
+        cart = generics.get_object_or_404(Cart.objects.with_totals().only('id'),pk=pk)
+        return Response(CartSummarySerializer(cart).data)
+
+class CartItemViewSet(SparseFieldsetMixin,CompiledListMixin,ModelViewSet):
     http_method_names = ['get','post','patch','delete']
     def get_queryset(self):
-        return CartItem.objects.select_related('product').filter(cart_id = self.kwargs['cart_pk'])
+        return CartItem.objects.with_total_price().select_related('product').filter(cart_id = self.kwargs['cart_pk'])
+
+    def get_serializer(self, *args, **kwargs):
+        # A list of items is added in one batch
+        if isinstance(kwargs.get('data'), list):
+            kwargs['many'] = True
+        return super().get_serializer(*args, **kwargs)
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -84,40 +129,166 @@ class CartItemViewSet(ModelViewSet):
         return {'cart_id': self.kwargs['cart_pk']}
 
 
-class CustomerViewSet(ModelViewSet):
+# Same API as CartViewSet/CartItemViewSet, served from a write-behind cart store (store.carts.CacheCartStore).
+# Item ids are the product ids, as a cart holds one item per product.
+
+class CacheCartViewSet(ViewSet):
+    def get_state(self,pk):
+        state = get_cart_store().get(pk)
+        if state is None:
+            raise Http404
+        return state
+
+    def create(self,request):
+        store = get_cart_store()
+        serializer = CartSerializer(store.to_cart(store.create()))
+        return Response(serializer.data,status=status.HTTP_201_CREATED)
+
+    def retrieve(self,request,pk=None):
+        serializer = CartSerializer(get_cart_store().to_cart(self.get_state(pk)))
+        return Response(serializer.data)
+
+    def destroy(self,request,pk=None):
+        get_cart_store().delete(self.get_state(pk))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True,methods=['GET'])
+    def summary(self,request,pk=None):
+        serializer = CartSummarySerializer(get_cart_store().to_cart(self.get_state(pk)))
+        return Response(serializer.data)
+
+class CacheCartItemViewSet(ViewSet):
+    http_method_names = ['get','post','patch','delete']
+
+    def get_state(self,cart_pk):
+        state = get_cart_store().get(cart_pk)
+        if state is None:
+            raise Http404
+        return state
+
+    def get_item(self,state,pk):
+        store = get_cart_store()
+        items = [item for item in store.to_cart(state).items if str(item.id) == str(pk)]
+        if not items:
+            raise Http404
+        return items[0]
+
+    def list(self,request,cart_pk=None):
+        cart = get_cart_store().to_cart(self.get_state(cart_pk))
+        return Response(CartItemSerializer(cart.items,many=True).data)
+
+    def retrieve(self,request,cart_pk=None,pk=None):
+        item = self.get_item(self.get_state(cart_pk),pk)
+        return Response(CartItemSerializer(item).data)
+
+    def create(self,request,cart_pk=None):
+        state = self.get_state(cart_pk)
+        many = isinstance(request.data,list)
+        serializer = AddCartItemSerializer(data=request.data,many=many,context={'cart_id': cart_pk})
+        serializer.is_valid(raise_exception=True)
+        items = [(item['product_id'],item['quantity']) for item in (serializer.validated_data if many else [serializer.validated_data])]
+        product_ids = {product_id for product_id,quantity in items}
+        if Product.objects.filter(id__in=product_ids).count() < len(product_ids):
+            raise serializers.ValidationError({'product_id': ['No product with the given product ID exists']})
+        get_cart_store().add_items(state,items)
+        added = [CartItem(id=product_id,product_id=product_id,quantity=state['items'][product_id]) for product_id in dict(items)]
+        data = AddCartItemSerializer(added,many=True).data if many else AddCartItemSerializer(added[0]).data
+        return Response(data,status=status.HTTP_201_CREATED)
+
+    def partial_update(self,request,cart_pk=None,pk=None):
+        state = self.get_state(cart_pk)
+        item = self.get_item(state,pk)
+        serializer = UpdateCartItemSerializer(item,data=request.data,partial=True)
+        serializer.is_valid(raise_exception=True)
+        quantity = serializer.validated_data.get('quantity',item.quantity)
+        get_cart_store().set_item_quantity(state,item.product_id,quantity)
+        item.quantity = quantity
+        return Response(UpdateCartItemSerializer(item).data)
+
+    def destroy(self,request,cart_pk=None,pk=None):
+        state = self.get_state(cart_pk)
+        item = self.get_item(state,pk)
+        get_cart_store().remove_item(state,item.product_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CustomerViewSet(SparseFieldsetMixin,ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [IsAdminUser]
 
     @action(detail=False,methods=['GET','PUT'],permission_classes=[IsAuthenticated])
     def me(self,request):
-        customer = Customer.objects.get(id=request.user.id)
+        customer = get_request_customer(request)
         if request.method == 'GET':
-            serializer = self.serializer_class(customer)
+            serializer = self.get_serializer(customer)
         elif request.method == 'PUT':
-            serializer = self.serializer_class(customer,data=request.data)
+            serializer = self.get_serializer(customer,data=request.data)
             serializer.is_valid(raise_exception=True)
             serializer.save()
         return Response(serializer.data)
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(SparseFieldsetMixin,ModelViewSet):
     http_method_names = ['get','post','patch','delete','head','options']
+    pagination_class = CursorOptInPagination
+    # Order of ?cursor= pages
+    ordering = ['-placed_at']
 
     def get_permissions(self):
-        if self.request.method in ['PUT','PATCH','DELETE']:
+        if self.request.method in ['PUT','PATCH','DELETE'] or self.action in ['export','payment_status']:
             return [IsAdminUser()]
         return [IsAuthenticated()]
 
+    # Streams every order matching ?placed_at__gte=&placed_at__lt= with its items, archived ones included,
+    # as NDJSON (one order per line) or CSV (one item per line, ?export_format=csv).
+    @action(detail=False,methods=['GET'])
+    def export(self,request):
+        exporters = {
+            'ndjson': (export_orders_ndjson, 'application/x-ndjson'),
+            'csv': (export_orders_csv, 'text/csv'),
+        }
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in exporters:
+            return Response({'error':f'export_format must be one of: {", ".join(exporters)}'},status=status.HTTP_400_BAD_REQUEST)
+
+        # Archived orders first, as they are the older ones
+        filtersets = [OrderFilter(request.query_params, queryset=model.objects.all()) for model in (ArchivedOrder, Order)]
+        if not filtersets[0].is_valid():
+            return Response(filtersets[0].errors,status=status.HTTP_400_BAD_REQUEST)
+
+        exporter, content_type = exporters[export_format]
+        response = StreamingHttpResponse(exporter([filterset.qs for filterset in filtersets]), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        return response
+
+    # Staff bulk payment status changes: a list of {"id": ..., "payment_status": ...}.
+    # All or nothing: one invalid transition rejects the whole list.
+    @action(detail=False,methods=['POST'],url_path='payment-status')
+    def payment_status(self,request):
+        serializer = PaymentStatusChangeSerializer(data=request.data,many=True)
+        serializer.is_valid(raise_exception=True)
+        new_statuses = {change['id']: change['payment_status'] for change in serializer.validated_data}
+        try:
+            with transaction.atomic():
+                changes = Order.objects.change_payment_statuses(new_statuses)
+                # One notification for the whole batch
+                if changes:
+                    outbox.publish('order_payment_status_changed',changes=changes)
+        except PaymentStatusTransitionError as error:
+            return Response({'errors':[{'id':order_id,'error':message} for order_id,message in error.errors.items()]},status=status.HTTP_400_BAD_REQUEST)
+        return Response({'updated':len(changes),'unchanged':len(new_statuses) - len(changes)})
+
     def create(self, request, *args, **kwargs):
         serializer = CreateOrderSerializer(data=request.data,context=self.get_serializer_context())
         serializer.is_valid(raise_exception=True)
         order = serializer.save()
 
-        serializer = OrderSerializer(order)
+        # Reloaded with its items and their products prefetched
+        serializer = OrderSerializer(self.get_queryset().get(pk=order.pk))
         return Response(serializer.data)
 
     def get_serializer_context(self):
-        return {'user_id': self.request.user.id}
+        return {'user_id': self.request.user.id, 'request': self.request}
     
     def get_serializer_class(self):
         request_method_serializer_map = {
@@ -133,10 +304,77 @@ class OrderViewSet(ModelViewSet):
         
     def get_queryset(self):
         user = self.request.user
+        # Items and their products in one extra query, whatever the page size
+        queryset = Order.objects.prefetch_related(
+            Prefetch('orderitem_set',queryset=OrderItem.objects.select_related('product')))
+        if self.action in ['update','partial_update']:
+            queryset = queryset.select_for_update()
         if user.is_staff:
-            return Order.objects.all()
-        customer_id = Customer.objects.only('id').get(user=user)
-        return Order.objects.filter(customer_id=customer_id)
+            return queryset
+        return queryset.filter(customer_id=get_request_customer_id(self.request))
+
+    def update(self, request, *args, **kwargs):
+        # The order stays locked while UpdateOrderSerializer checks the payment status transition,
+        # and the change is written to the outbox in the same transaction
+        with transaction.atomic():
+            return super().update(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        # Ids missing from store_order may have been archived (store.archive)
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            order = generics.get_object_or_404(self.get_archived_queryset(),pk=kwargs['pk'])
+            return Response(self.get_serializer(order).data)
+
+    def get_archived_queryset(self):
+        queryset = ArchivedOrder.objects.prefetch_related(
+            Prefetch('orderitem_set',queryset=ArchivedOrderItem.objects.select_related('product')))
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(customer_id=get_request_customer_id(self.request))
+
+
+# Staff sales dashboards, served from the rollup tables (store.rollups) instead of aggregating order items.
+# ?date__gte=&date__lte= and ?payment_status= narrow the rows, ?limit= caps the result (default 50).
+class SalesReportViewSet(ViewSet):
+    permission_classes = [IsAdminUser]
+    default_limit = 50
+    max_limit = 1000
+
+    def report(self, request, filterset_class, queryset, group_by):
+        filterset = filterset_class(request.query_params, queryset=queryset)
+        if not filterset.is_valid():
+            return Response(filterset.errors,status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            return Response({'limit':['A valid integer is required.']},status=status.HTTP_400_BAD_REQUEST)
+        rows = filterset.qs \
+            .values(*group_by) \
+            .annotate(units=Sum('units'),revenue=Sum('revenue'),orders_count=Sum('orders_count')) \
+            .order_by('-revenue',*group_by)[:max(limit, 0)]
+        return Response(list(rows))
+
+    @action(detail=False,methods=['GET'])
+    def products(self,request):
+        return self.report(request, ProductSalesRollupFilter, ProductSalesRollup.objects.all(), ['product_id','product__title'])
+
+    @action(detail=False,methods=['GET'])
+    def collections(self,request):
+        return self.report(request, CollectionSalesRollupFilter, CollectionSalesRollup.objects.all(), ['collection_id','collection__title'])
+
+    # Per day totals across all collections (?collection_id= for one). orders_count counts an
+    # order once for each collection it bought from.
+    @action(detail=False,methods=['GET'])
+    def daily(self,request):
+        queryset = CollectionSalesRollup.objects.all()
+        collection_id = request.query_params.get('collection_id')
+        if collection_id:
+            if not collection_id.isdigit():
+                return Response({'collection_id':['A valid integer is required.']},status=status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(collection_id=collection_id)
+        return self.report(request, CollectionSalesRollupFilter, queryset, ['date'])
         
 
 # ------------- FUNCTION BASED VIEWS ----------------- #
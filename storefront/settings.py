@@ -149,7 +149,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING': False,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.ClaimsJWTAuthentication',
     ),
 }
 
@@ -161,6 +161,37 @@ SIMPLE_JWT = {
 # Swap out builtin user model of django with our custom user model.
 AUTH_USER_MODEL = 'core.User'
 
+# Use a shared backend (Redis, Memcached) in production so every worker sees the same cached responses and version counters.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Seconds a cached product list/detail response is kept
+STORE_RESPONSE_CACHE_TIMEOUT = 300
+
+# Product search backend. Alternatives: 'store.search.SQLiteFTS5Backend', 'store.search.MySQLFulltextBackend'
+STORE_SEARCH_BACKEND = 'store.search.InvertedIndexBackend'
+
+# Cart storage. 'store.carts.CacheCartStore' keeps carts in the cache and writes them to the
+# database with `manage.py flush_carts`; it needs a shared cache backend outside development.
+STORE_CART_BACKEND = 'store.carts.DatabaseCartStore'
+# Seconds a cart is kept in the cache; must be well above the flush_carts interval
+STORE_CART_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+# Number of cache sets the changed cart ids are spread over (each is locked while it changes)
+STORE_CART_DIRTY_BUCKETS = 64
+# Carts created longer ago than this are deleted by `manage.py sweep_carts`
+STORE_CART_TTL = timedelta(days=30)
+
+# Orders placed longer ago than this are moved to the archive tables by `manage.py archive_orders`
+STORE_ORDER_ARCHIVE_AFTER = timedelta(days=365)
+
+# Attempts before `manage.py process_outbox` gives up on a message
+STORE_OUTBOX_MAX_ATTEMPTS = 10
+# How long a claimed outbox message is left to its worker before another worker may send it
+STORE_OUTBOX_CLAIM_TIMEOUT = timedelta(minutes=5)
+
 DJOSER = {
     'SERIALIZERS':{
         'user_create':'core.serializers.UserCreateSerializer',
@@ -17,6 +17,8 @@ from django.contrib import admin
 from django.urls import path, include
 import debug_toolbar
 
+from core.views import TokenObtainPairView
+
 admin.site.site_header = 'Storefront Admin'
 admin.site.index_title = 'Admin'
 
@@ -25,6 +27,8 @@ urlpatterns = [
     path('playground/', include('playground.urls')),
     path('store/',include('store.urls')),
     path('auth/', include('djoser.urls')),
+    # Issues tokens with the claims core.authentication.ClaimsJWTAuthentication relies on
+    path('auth/jwt/create/', TokenObtainPairView.as_view(), name='jwt-create'),
     path('auth/', include('djoser.urls.jwt')),
     path('__debug__/', include(debug_toolbar.urls)),
 ]